@@ -0,0 +1,548 @@
+"""Офлайн-бенчмарк полного цикла отчета
+
+Поднимает локальные заглушки ReportPortal, трекера задач и Telegram Bot API
+с синтетическими данными заданного масштаба и измеряет время send_report_to_chat, число
+запросов к каждому endpoint и пиковое потребление памяти.
+
+С --startup вместо отчета измеряется время запуска: импорт main.py и
+report_bot.py по python -X importtime, с проверкой, что python-telegram-bot
+не загружается при импорте, и сравнением с бюджетом --startup-budget-ms.
+
+С --triage-check проверяется, что разбор дефектов после завершения запусков
+попадает в отчет: отчет собирается, на заглушке меняются комментарии тестов
+и lastModified запусков, и повторный отчет должен содержать новые ссылки.
+
+Пример:
+    python bench.py --launches 200 --items 1500 --latency 20 --runs 2
+    python main.py bench --startup --startup-budget-ms 400
+    python main.py bench --triage-check --launches 20 --items 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+BENCH_CHAT_ID = 1
+BENCH_TOKEN = "123456:bench"
+# Модули, которые не должны загружаться при импорте точки входа и report_bot
+STARTUP_FORBIDDEN_MODULES = ("telegram", "pytz")
+# Бюджет времени импорта report_bot, мс
+STARTUP_BUDGET_MS = 400
+
+
+def generate_launches(launch_count, seed=0):
+    """Синтетические запуски для проектов superadmin_personal и linux_tests"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    launches = {"superadmin_personal": [], "linux_tests": []}
+
+    for number in range(launch_count):
+        start_time = (now - timedelta(minutes=rng.randint(1, 20 * 60))).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        total = rng.randint(100, 3000)
+        failed = rng.randint(0, total // 10)
+        statistics = {
+            "executions": {"total": total, "passed": total - failed, "failed": failed},
+            "defects": {"product_bug": {"total": failed, "pb001": failed}}
+        }
+
+        version = rng.choice(["3.30", "3.29"])
+        launches["superadmin_personal"].append({
+            "id": 100000 + number,
+            "number": number,
+            "name": f"superadmin {version}",
+            "status": "FAILED" if failed else "PASSED",
+            "startTime": start_time,
+            "lastModified": start_time,
+            "statistics": statistics,
+            "attributes": [
+                {"key": "FullVersion", "value": f"{version}.{rng.randint(0, 99)}"},
+                {"key": "Version", "value": version},
+                {"key": "Re-launch", "value": "true"},
+                {"key": "Db type", "value": "postgres"},
+                {"key": "Branch name", "value": f"release/{version}"},
+                {"key": "Commit hash", "value": f"{rng.getrandbits(40):010x}"}
+            ]
+        })
+
+        launches["linux_tests"].append({
+            "id": 200000 + number,
+            "number": number,
+            "name": "linux",
+            "status": "FAILED" if failed else "PASSED",
+            "startTime": start_time,
+            "lastModified": start_time,
+            "statistics": statistics,
+            "attributes": [
+                {"key": "OS", "value": "Linux"},
+                {"key": "Database", "value": "PostgreSQL"},
+                {"key": "Branch", "value": f"feature/{number % max(1, launch_count // 2)}"},
+                {"key": "Commit hash", "value": f"{number:010x}"},
+                {"key": "Version", "value": version}
+            ]
+        })
+
+    return launches
+
+
+class FakeReportPortal:
+    """Заглушка ReportPortal: OAuth, список запусков и тесты с дефектами"""
+
+    def __init__(self, launches, items_per_launch, latency):
+        self.launches = launches
+        self.items_per_launch = items_per_launch
+        self.latency = latency
+        self.requests = Counter()
+        self.triage_round = 0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.requests[name] += 1
+
+    def triage(self):
+        """Повторный разбор всех завершенных запусков: новые ссылки и lastModified"""
+        with self._lock:
+            self.triage_round += 1
+            modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            for launches in self.launches.values():
+                for launch in launches:
+                    launch["lastModified"] = modified
+
+    def handle(self, method, path, query):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == "POST" and path == "/uat/sso/oauth/token":
+            self.count("oauth/token")
+            return {"access_token": "bench-token", "refresh_token": "bench-refresh", "expires_in": 3600}
+
+        parts = path.strip("/").split("/")
+        if len(parts) >= 4 and parts[:2] == ["api", "v1"]:
+            project = parts[2]
+            if parts[3] == "launch":
+                self.count(f"{project}/launch")
+                return self._launch_page(project, query)
+            if parts[3:] == ["item", "v2"]:
+                self.count(f"{project}/item/v2")
+                return self._item_page(query)
+        return None
+
+    @staticmethod
+    def _page(content, query):
+        page = int(query.get("page.page", 1))
+        size = int(query.get("page.size", 50))
+        total_pages = max(1, -(-len(content) // size))
+        return {
+            "content": content[(page - 1) * size:page * size],
+            "page": {"number": page, "size": size, "totalElements": len(content), "totalPages": total_pages}
+        }
+
+    def _launch_page(self, project, query):
+        launches = self.launches.get(project, [])
+        if "filter.gte.startTime" in query:
+            since = query["filter.gte.startTime"].rstrip("Z")[:19]
+            launches = [launch for launch in launches if launch["startTime"][:19] >= since]
+        if "filter.in.id" in query:
+            ids = {int(launch_id) for launch_id in query["filter.in.id"].split(",")}
+            launches = [launch for launch in launches if launch["id"] in ids]
+        if "filter.in.status" in query:
+            statuses = set(query["filter.in.status"].split(","))
+            launches = [launch for launch in launches if launch["status"] in statuses]
+        if "filter.has.compositeAttribute" in query:
+            pairs = [pair.split(":", 1) for pair in query["filter.has.compositeAttribute"].split(",")]
+            launches = [
+                launch for launch in launches
+                if all({"key": key, "value": value} in launch["attributes"] for key, value in pairs)
+            ]
+        launches = sorted(launches, key=lambda launch: (launch["startTime"], launch["number"]))
+        return self._page(launches, query)
+
+    def _item_page(self, query):
+        launch_id = int(query.get("launchId", 0))
+        rng = random.Random(launch_id)
+        items = [
+            {
+                "id": launch_id * 100000 + index,
+                "uniqueId": f"auto:{index:08x}",
+                "name": f"test_{index}",
+                "status": "FAILED" if rng.random() < 0.3 else "PASSED",
+                "pathNames": {"itemPaths": [{"id": launch_id, "name": "suite"}]},
+                "issue": {
+                    "issueType": "pb001",
+                    "comment": f"https://jira.a2nta.ru/browse/QA-{rng.randint(1, 400) + 400 * self.triage_round}",
+                    "autoAnalyzed": False,
+                    "ignoreAnalyzer": False
+                }
+            }
+            for index in range(self.items_per_launch)
+        ]
+        if "filter.in.status" in query:
+            statuses = set(query["filter.in.status"].split(","))
+            items = [item for item in items if item["status"] in statuses]
+        return self._page(items, query)
+
+
+class FakeIssueTracker:
+    """Заглушка поиска задач Jira: часть ключей считается отсутствующей в трекере"""
+
+    STATUSES = (("Открыт", "new"), ("В работе", "indeterminate"), ("Исправлен", "done"))
+
+    def __init__(self, latency, missing_ratio=0.1):
+        self.latency = latency
+        self.missing_ratio = missing_ratio
+        self.requests = Counter()
+        self.keys = Counter()
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if method != "POST" or path != "/rest/api/2/search":
+            return None
+        jql = body.get("jql", "")
+        keys = [key.strip() for key in jql[jql.find("(") + 1:jql.rfind(")")].split(",") if key.strip()]
+        with self._lock:
+            self.requests["search"] += 1
+            self.keys.update(keys)
+
+        issues = []
+        for key in keys:
+            rng = random.Random(key)
+            if rng.random() < self.missing_ratio:
+                continue
+            status, category = rng.choice(self.STATUSES)
+            issues.append({
+                "key": key,
+                "fields": {
+                    "summary": f"Дефект {key}",
+                    "status": {"name": status, "statusCategory": {"key": category}},
+                    "assignee": {"displayName": f"user{rng.randint(1, 20)}"} if rng.random() < 0.7 else None
+                }
+            })
+        return {"startAt": 0, "maxResults": len(keys), "total": len(issues), "issues": issues}
+
+
+class FakeTelegram:
+    """Заглушка Telegram Bot API: принимает любые методы и считает сообщения"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = Counter()
+        self.sent_chars = 0
+        self._lock = threading.Lock()
+        self._message_id = 0
+
+    def handle(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        api_method = path.rsplit("/", 1)[-1]
+        with self._lock:
+            self.requests[api_method] += 1
+            self._message_id += 1
+            message_id = self._message_id
+            self.sent_chars += len(body.get("text", ""))
+        return {
+            "ok": True,
+            "result": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(body.get("chat_id", BENCH_CHAT_ID)), "type": "group", "title": "bench"},
+                "text": body.get("text", "")
+            }
+        }
+
+
+def start_server(handler):
+    """Запускаем HTTP-сервер заглушки в фоновом потоке, возвращаем (server, base_url)"""
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _respond(self, method):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            raw_body = self.rfile.read(length) if length else b""
+            if "json" in (self.headers.get("Content-Type") or ""):
+                body = json.loads(raw_body or b"{}")
+            else:
+                body = {key: values[-1] for key, values in parse_qs(raw_body.decode()).items()}
+            result = handler(method, url.path, {**query, **body} if method == "GET" else body or query)
+            payload = json.dumps(result if result is not None else {"message": "not found"}).encode()
+            # GET-ответы снабжаются ETag, повторный запрос с тем же ETag получает 304
+            etag = f'"{hashlib.sha1(payload).hexdigest()}"' if method == "GET" and result is not None else None
+            if etag and self.headers.get("If-None-Match") == etag:
+                server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200 if result is not None else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    server.daemon_threads = True
+    server.not_modified = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def configure_environment(rp_url, tracker_url, work_dir, telegram_rate, shard_workers, http_cache):
+    """Переменные окружения для report_bot.py до его импорта"""
+    os.environ.update({
+        "TELEGRAM_GROUP_RATE_PER_MINUTE": str(telegram_rate),
+        "TELEGRAM_PRIVATE_RATE_PER_MINUTE": str(telegram_rate),
+        "REPORT_PORTAL_USERNAME": "bench",
+        "REPORT_PORTAL_PASSWORD": "bench",
+        "TELEGRAM_TOKEN": BENCH_TOKEN,
+        "TELEGRAM_CHAT_ID": str(BENCH_CHAT_ID),
+        "REPORTPORTAL_URL": rp_url,
+        "ISSUE_TRACKER_URL": tracker_url,
+        "ISSUE_CACHE_FILE": "",
+        "HTTP_CACHE_DIR": os.path.join(work_dir, "http_cache") if http_cache else "",
+        "REPORT_SHARD_WORKERS": str(shard_workers),
+        "LAUNCH_STORE_PATH": os.path.join(work_dir, "launches.db"),
+        "TREND_STORE_PATH": os.path.join(work_dir, "trend.db"),
+        "DEFECT_CACHE_FILE": "",
+        "FAILED_ITEMS_CACHE_FILE": "",
+        "TOKEN_CACHE_FILE": "",
+    })
+
+
+async def run_benchmark(args, rp, telegram_url):
+    import report_bot
+    from telegram.ext import ApplicationBuilder
+
+    application = ApplicationBuilder().token(BENCH_TOKEN).base_url(f"{telegram_url}/bot").build()
+    results = []
+    try:
+        for run in range(1, args.runs + 1):
+            rp.requests.clear()
+            report_bot.METRICS.reset()
+            # Отчет собирается заново в каждом прогоне, прогревать можно только
+            # соединения, токен, хранилище запусков и кэш дефектов
+            application.bot_data.pop("report_builder", None)
+
+            # tracemalloc заметно замедляет выполнение, поэтому включается отдельно;
+            # без него выводится пиковый RSS процесса
+            if args.trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            await report_bot.send_report_to_chat(application, BENCH_CHAT_ID)
+            elapsed = time.perf_counter() - started
+            if args.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            else:
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+            results.append({
+                "run": run,
+                "seconds": round(elapsed, 3),
+                "peak_memory_mb": round(peak / 1024 / 1024, 2),
+                "reportportal_requests": dict(sorted(rp.requests.items())),
+                "metrics": report_bot.METRICS.summary(),
+            })
+    finally:
+        await report_bot.close_rp_client(application)
+    return results
+
+
+async def run_triage_check(rp):
+    """Отчет до и после повторного разбора; возвращает запуски со старыми ссылками"""
+    import report_bot
+
+    context = SimpleNamespace(bot_data={})
+    try:
+        client = report_bot.get_rp_client(context)
+        before = await report_bot.build_report(client)
+        rp.triage()
+        after = await report_bot.build_report(client)
+    finally:
+        await report_bot.close_rp_client(context)
+    previous = {entry.launch.id: entry.defects for entry in before.entries}
+    return [entry.launch.id for entry in after.entries
+            if entry.defects and entry.defects == previous.get(entry.launch.id)]
+
+
+def measure_import(module, runs):
+    """Минимальное за runs запусков время импорта module (мс) и загруженные лишние модули
+
+    Импорт выполняется в отдельном процессе без переменных окружения отчета:
+    модуль не должен требовать их при импорте.
+    """
+    check = (f"import sys, {module}; "
+             f"print(','.join(m for m in {STARTUP_FORBIDDEN_MODULES!r} if m in sys.modules))")
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith(("REPORT_PORTAL_", "TELEGRAM_"))}
+    best = None
+    forbidden = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", check],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            capture_output=True, text=True, check=True
+        )
+        # Строки вида "import time: self [us] | cumulative | module", модуль
+        # верхнего уровня записан без отступа
+        for line in completed.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].rstrip() == f" {module}":
+                cumulative = int(fields[1]) / 1000
+                best = cumulative if best is None else min(best, cumulative)
+        forbidden = [name for name in completed.stdout.strip().split(",") if name]
+    return best, forbidden
+
+
+def run_startup(args):
+    """Замер времени запуска; возвращает False, если бюджет превышен"""
+    ok = True
+    results = {}
+    for module in ("main", "report_bot"):
+        milliseconds, forbidden = measure_import(module, args.runs)
+        results[module] = {"import_ms": round(milliseconds, 1), "forbidden_modules": forbidden}
+        if forbidden:
+            ok = False
+    within_budget = results["report_bot"]["import_ms"] <= args.startup_budget_ms
+    ok = ok and within_budget
+
+    if args.json:
+        json.dump({"budget_ms": args.startup_budget_ms, "ok": ok, "imports": results},
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return ok
+
+    for module, result in results.items():
+        print(f"Импорт {module}: {result['import_ms']} мс (минимум из {args.runs})")
+        if result["forbidden_modules"]:
+            print(f"    при импорте загружены: {', '.join(result['forbidden_modules'])}")
+    verdict = "в пределах бюджета" if within_budget else "превышает бюджет"
+    print(f"Импорт report_bot {verdict} {args.startup_budget_ms} мс")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк отчета ReportPortal -> Telegram")
+    parser.add_argument("--launches", type=int, default=50, help="запусков в каждом проекте")
+    parser.add_argument("--items", type=int, default=500, help="тестов с дефектами в каждом запуске")
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа ReportPortal, мс")
+    parser.add_argument("--tracker-latency", type=float, default=0, help="задержка ответа трекера задач, мс")
+    parser.add_argument("--telegram-latency", type=float, default=0, help="задержка ответа Telegram, мс")
+    parser.add_argument("--telegram-rate", type=int, default=1000000,
+                        help="лимит сообщений в минуту на чат (по умолчанию ограничение фактически снято)")
+    parser.add_argument("--shard-workers", type=int, default=0,
+                        help="собирать отчет по шардам (проект, ветка) этим числом обработчиков, 0 - без шардов")
+    parser.add_argument("--no-http-cache", action="store_true", help="отключить HTTP-кэш ответов ReportPortal")
+    parser.add_argument("--runs", type=int, default=1, help="число последовательных прогонов (холодный + теплые)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="пик памяти отчета через tracemalloc (медленнее) вместо пикового RSS процесса")
+    parser.add_argument("--top-stages", type=int, default=8, help="сколько самых долгих этапов показать")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    parser.add_argument("--startup", action="store_true",
+                        help="измерить время импорта main.py и report_bot.py вместо отчета")
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                        help="бюджет времени импорта report_bot.py, мс")
+    parser.add_argument("--triage-check", action="store_true",
+                        help="проверить, что разбор дефектов после завершения запусков попадает в отчет")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        if not run_startup(args):
+            sys.exit(1)
+        return
+
+    rp = FakeReportPortal(generate_launches(args.launches), args.items, args.latency / 1000)
+    tracker = FakeIssueTracker(args.tracker_latency / 1000)
+    telegram = FakeTelegram(args.telegram_latency / 1000)
+    rp_server, rp_url = start_server(rp.handle)
+    tracker_server, tracker_url = start_server(tracker.handle)
+    telegram_server, telegram_url = start_server(telegram.handle)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(rp_url, tracker_url, work_dir, args.telegram_rate, args.shard_workers,
+                              not args.no_http_cache)
+        try:
+            if args.triage_check:
+                stale = asyncio.run(run_triage_check(rp))
+            else:
+                results = asyncio.run(run_benchmark(args, rp, telegram_url))
+        finally:
+            rp_server.shutdown()
+            tracker_server.shutdown()
+            telegram_server.shutdown()
+
+    if args.triage_check:
+        if stale:
+            print(f"После повторного разбора в отчете остались старые дефекты запусков: "
+                  f"{', '.join(map(str, stale))}")
+            sys.exit(1)
+        print("Повторный разбор дефектов попал в отчет")
+        return
+
+    summary = {
+        "scale": {"launches": args.launches, "items": args.items, "latency_ms": args.latency,
+                  "shard_workers": args.shard_workers},
+        "runs": results,
+        "reportportal_not_modified": rp_server.not_modified,
+        "tracker_requests": dict(tracker.requests),
+        "tracker_keys": {"requested": sum(tracker.keys.values()), "unique": len(tracker.keys)},
+        "telegram_requests": dict(telegram.requests),
+        "telegram_chars": telegram.sent_chars,
+    }
+    if args.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print(f"Масштаб: {args.launches} запусков на проект, {args.items} тестов в запуске, "
+          f"задержка {args.latency} мс, обработчиков шардов {args.shard_workers or 'нет'}")
+    for result in results:
+        requests_total = sum(result["reportportal_requests"].values())
+        memory = "пик памяти" if args.trace_memory else "пиковый RSS"
+        print(f"Прогон {result['run']}: {result['seconds']} с, {memory} {result['peak_memory_mb']} МБ, "
+              f"запросов к ReportPortal {requests_total}")
+        for endpoint, count in result["reportportal_requests"].items():
+            print(f"    {endpoint}: {count}")
+        # Этапы с наибольшим суммарным временем
+        timers = sorted(result["metrics"]["timers"], key=lambda timer: -timer["total_seconds"])
+        for timer in timers[:args.top_stages]:
+            labels = ", ".join(f"{key}={value}" for key, value in timer["labels"].items())
+            print(f"    этап {timer['name']} [{labels}]: вызовов {timer['count']}, "
+                  f"всего {timer['total_seconds']} с, максимум {timer['max_seconds']} с")
+    print(f"ReportPortal: ответов 304 Not Modified {rp_server.not_modified}")
+    print(f"Трекер задач: запросов {tracker.requests['search']}, ключей {sum(tracker.keys.values())} "
+          f"(уникальных {len(tracker.keys)})")
+    print(f"Telegram: {dict(telegram.requests)}, символов {telegram.sent_chars}")
+
+
+if __name__ == '__main__':
+    main()
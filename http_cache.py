@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def parse_freshness(spec):
+    """Политика свежести из строки вида "launch=0,item/v2=60"
+
+    Ключ - окончание пути endpoint, значение - сколько секунд ответ отдается
+    из кэша без обращения к серверу. После этого ответ перепроверяется
+    условным запросом (If-None-Match / If-Modified-Since).
+    """
+    policy = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        suffix, _, seconds = part.partition("=")
+        try:
+            policy[suffix.strip().strip("/")] = float(seconds or 0)
+        except ValueError:
+            raise ValueError(f"Некорректная политика свежести HTTP-кэша: {part}") from None
+    return policy
+
+
+def cache_key(request):
+    """Ключ ответа: метод и полный URL (заголовок Authorization не учитывается)"""
+    return hashlib.sha256(f"{request.method} {request.url}".encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    status: int
+    headers: list
+    body: bytes
+    etag: str
+    last_modified: str
+    stored_at: float
+
+    def to_response(self, request):
+        return httpx.Response(self.status, headers=self.headers, content=self.body, request=request)
+
+
+class HttpCache:
+    """Дисковый кэш HTTP-ответов
+
+    Тела ответов хранятся по адресу содержимого (SHA-256) в каталоге blobs:
+    одинаковые страницы разных запросов занимают место один раз. Индекс
+    (URL, заголовки, валидаторы, время сохранения и использования) - в SQLite.
+    Суммарный размер тел ограничен max_bytes, при превышении удаляются
+    давно не использованные ответы. clock - источник текущего времени для
+    свежести и порядка вытеснения.
+    """
+
+    def __init__(self, directory, max_bytes, clock=time.time):
+        self.clock = clock
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._blobs = os.path.join(directory, "blobs")
+        os.makedirs(self._blobs, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+            CREATE INDEX IF NOT EXISTS responses_digest ON responses (digest);
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blobs, digest[:2], digest[2:])
+
+    def lookup(self, key):
+        """Сохраненный ответ (CachedResponse) или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, headers, digest, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            status, headers, digest, etag, last_modified, stored_at = row
+            try:
+                with open(self._blob_path(digest), "rb") as f:
+                    body = f.read()
+            except OSError:
+                # Тело удалено с диска - запись больше не годится
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (self.clock(), key))
+            self._conn.commit()
+        return CachedResponse(status, json.loads(headers), body, etag, last_modified, stored_at)
+
+    def store(self, key, url, status, headers, body):
+        """Сохраняем ответ и удаляем старые, если кэш превысил max_bytes"""
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        header_map = httpx.Headers(headers)
+        now = self.clock()
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Запись через временный файл: читатель не увидит недописанное тело
+                temporary = f"{path}.{os.getpid()}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(body)
+                os.replace(temporary, path)
+            previous = self._conn.execute("SELECT digest FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("""
+                INSERT OR REPLACE INTO responses
+                    (key, url, status, headers, digest, size, etag, last_modified, stored_at, used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (key, url, status, json.dumps(headers), digest, len(body),
+                  header_map.get("etag"), header_map.get("last-modified"), now, now))
+            if previous and previous[0] != digest:
+                self._drop_blob(previous[0])
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, key):
+        """Ответ подтвержден сервером (304): он снова свежий"""
+        now = self.clock()
+        with self._lock:
+            self._conn.execute("UPDATE responses SET stored_at = ?, used_at = ? WHERE key = ?", (now, now, key))
+            self._conn.commit()
+
+    def size(self):
+        """Суммарный размер хранимых тел (каждое тело учитывается один раз)"""
+        with self._lock:
+            return self._total_size()
+
+    def _total_size(self):
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM responses)"
+        ).fetchone()[0]
+
+    def _drop_blob(self, digest):
+        """Удаляем тело, если на него больше не ссылается ни один ответ"""
+        if self._conn.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            pass
+
+    def _evict(self):
+        total = self._total_size()
+        evicted = 0
+        while total > self.max_bytes:
+            row = self._conn.execute("SELECT key, digest FROM responses ORDER BY used_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            key, digest = row
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._drop_blob(digest)
+            total = self._total_size()
+            evicted += 1
+        if evicted:
+            METRICS.inc("http_cache_evicted", evicted)
+            logger.info(f"Из HTTP-кэша удалено {evicted} ответов, размер {total} байт")
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx с дисковым кэшем GET-ответов
+
+    Кэшируются только endpoint из политики свежести freshness
+    ({окончание пути: секунды}). Свежий ответ отдается без запроса, иначе
+    запрос отправляется с If-None-Match / If-Modified-Since, и на 304 тело
+    берется из кэша. Ответы 200 с ETag или Last-Modified (или с ненулевой
+    свежестью) сохраняются; Cache-Control: no-store соблюдается, Vary - нет:
+    кэш рассчитан на один сервисный аккаунт.
+    """
+
+    def __init__(self, transport, cache, freshness):
+        self._transport = transport
+        self._cache = cache
+        # Длинные окончания проверяются первыми: "launch/latest" раньше "launch"
+        self._freshness = sorted(freshness.items(), key=lambda item: -len(item[0]))
+
+    def _policy(self, path):
+        path = path.rstrip("/")
+        for suffix, seconds in self._freshness:
+            if path.endswith(f"/{suffix}") or path == suffix:
+                return suffix, seconds
+        return None, None
+
+    async def handle_async_request(self, request):
+        endpoint, freshness = self._policy(request.url.path)
+        if request.method != "GET" or endpoint is None:
+            return await self._transport.handle_async_request(request)
+
+        key = cache_key(request)
+        cached = await asyncio.to_thread(self._cache.lookup, key)
+        if cached is not None:
+            if self._cache.clock() - cached.stored_at < freshness:
+                METRICS.inc("http_cache", endpoint=endpoint, result="fresh")
+                return cached.to_response(request)
+            if cached.etag:
+                request.headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                request.headers["If-Modified-Since"] = cached.last_modified
+
+        response = await self._transport.handle_async_request(request)
+        if response.status_code == 304 and cached is not None:
+            await response.aclose()
+            await asyncio.to_thread(self._cache.touch, key)
+            METRICS.inc("http_cache", endpoint=endpoint, result="revalidated")
+            return cached.to_response(request)
+
+        METRICS.inc("http_cache", endpoint=endpoint, result="miss")
+        if not self._cacheable(response, freshness):
+            return response
+
+        # Тело читается из потока транспорта без распаковки: в кэше ответ
+        # хранится как есть, вместе с Content-Encoding
+        try:
+            body = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        if len(body) <= self._cache.max_bytes:
+            try:
+                await asyncio.to_thread(self._cache.store, key, str(request.url), response.status_code,
+                                        response.headers.multi_items(), body)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Не удалось сохранить ответ {request.url.path} в HTTP-кэш: {e}")
+        return httpx.Response(response.status_code, headers=response.headers, content=body,
+                              request=request, extensions=response.extensions)
+
+    @staticmethod
+    def _cacheable(response, freshness):
+        if response.status_code != 200:
+            return False
+        if "no-store" in response.headers.get("cache-control", ""):
+            return False
+        return bool(freshness) or "etag" in response.headers or "last-modified" in response.headers
+
+    async def aclose(self):
+        await self._transport.aclose()
+        await asyncio.to_thread(self._cache.close)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass
+
+import httpx
+
+from metrics import METRICS
+from persistent_cache import PersistentLRU
+from retry import RetryPolicy, request_timeout
+
+logger = logging.getLogger(__name__)
+
+# Ключ задачи Jira в ссылке вида https://jira.a2nta.ru/browse/QA-123
+_ISSUE_KEY_RE = re.compile(r"/browse/([A-Z][A-Z0-9_]*-\d+)/?$")
+
+# Порядок групп статусов в отчете по категории Jira; задачи, о которых нет
+# данных, выводятся последними
+STATUS_CATEGORY_ORDER = ("new", "indeterminate", "done")
+
+
+def issue_key(link):
+    """Ключ задачи трекера из ссылки на дефект или None, если ссылка не на Jira"""
+    match = _ISSUE_KEY_RE.search(link)
+    return match.group(1) if match else None
+
+
+@dataclass(frozen=True, slots=True)
+class Issue:
+    """Задача трекера: статус, заголовок и исполнитель"""
+    key: str
+    summary: str
+    status: str
+    category: str = None
+    assignee: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        fields = data.get("fields") or {}
+        status = fields.get("status") or {}
+        assignee = fields.get("assignee") or {}
+        return cls(
+            key=data["key"],
+            summary=fields.get("summary") or "",
+            status=status.get("name") or "Без статуса",
+            category=(status.get("statusCategory") or {}).get("key"),
+            assignee=assignee.get("displayName")
+        )
+
+
+class IssueCache:
+    """Кэш задач трекера с ограниченным временем жизни записей
+
+    Найденные задачи хранятся ttl секунд, отсутствующие в трекере (удаленные,
+    перенесенные, опечатки в ссылке) - negative_ttl секунд, чтобы не
+    запрашивать их в каждом отчете. Размер ограничен max_entries (LRU),
+    содержимое может сохраняться в JSON-файл между запусками бота.
+    """
+
+    def __init__(self, ttl, negative_ttl, max_entries, cache_file=None, clock=time.time):
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries = PersistentLRU(max_entries, cache_file, "кэш задач", clock)
+
+    def get(self, key):
+        """Пара (есть ли действующая запись, задача или None для отсутствующей)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        issue = entry["issue"]
+        return True, Issue(**issue) if issue is not None else None
+
+    def put(self, key, issue):
+        """Сохраняем задачу; issue=None - задача в трекере не найдена"""
+        ttl = self._ttl if issue is not None else self._negative_ttl
+        if ttl <= 0:
+            return
+        self._entries.put(key, {"issue": asdict(issue) if issue is not None else None}, ttl=ttl)
+
+    def save(self):
+        self._entries.save()
+
+
+class IssueTracker:
+    """Пакетный поиск задач Jira по ссылкам на дефекты
+
+    Ссылки отчета дедуплицируются по ключу задачи, задачи из кэша не
+    запрашиваются, остальные ищутся пачками по batch_size через
+    /rest/api/2/search (JQL key in (...)), не более concurrency запросов
+    одновременно. Ошибка трекера не прерывает отчет: задачи неудавшейся пачки
+    просто остаются без данных и не кэшируются.
+    """
+
+    def __init__(self, base_url, cache, token=None, batch_size=50, concurrency=4, timeout=30.0,
+                 retry_policy=None, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self._batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._timeout = timeout
+        self._retry_policy = retry_policy or RetryPolicy()
+        headers = {"Accept": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout, transport=transport)
+
+    async def aclose(self):
+        await self._client.aclose()
+        self.cache.save()
+
+    async def lookup(self, links):
+        """Задачи по ссылкам: словарь {ссылка: Issue}
+
+        В результат попадают только найденные задачи; ссылки не на Jira,
+        отсутствующие в трекере задачи и задачи, которые не удалось получить,
+        в нем отсутствуют.
+        """
+        keys = {}
+        for link in links:
+            key = issue_key(link)
+            if key:
+                keys.setdefault(key, []).append(link)
+
+        issues = {}
+        missing = []
+        for key in keys:
+            cached, issue = self.cache.get(key)
+            if not cached:
+                missing.append(key)
+                METRICS.inc("issue_cache", result="miss")
+                continue
+            METRICS.inc("issue_cache", result="hit" if issue is not None else "negative")
+            if issue is not None:
+                issues[key] = issue
+
+        batches = [missing[start:start + self._batch_size] for start in range(0, len(missing), self._batch_size)]
+        results = await asyncio.gather(*(self._search(batch) for batch in batches), return_exceptions=True)
+        for batch, found in zip(batches, results):
+            if isinstance(found, BaseException):
+                logger.warning(f"Не удалось получить задачи {', '.join(batch)} из трекера: {found}")
+                continue
+            for key in batch:
+                issue = found.get(key)
+                self.cache.put(key, issue)
+                if issue is not None:
+                    issues[key] = issue
+
+        logger.info(f"Задачи трекера: уникальных {len(keys)}, из кэша {len(keys) - len(missing)}, "
+                    f"запрошено {len(missing)} в {len(batches)} запросах")
+        return {link: issues[key] for key, key_links in keys.items() if key in issues for link in key_links}
+
+    async def _search(self, keys):
+        """Один запрос поиска по списку ключей: словарь {ключ: Issue}"""
+        url = f"{self.base_url}/rest/api/2/search"
+        body = {
+            "jql": f"key in ({','.join(keys)})",
+            "fields": ["summary", "status", "assignee"],
+            "maxResults": len(keys),
+            # Несуществующие ключи не должны приводить к ошибке всего запроса
+            "validateQuery": "warn"
+        }
+
+        async def attempt():
+            async with self._semaphore:
+                with METRICS.span("issue_search"):
+                    response = await self._client.post(url, json=body, timeout=request_timeout(self._timeout))
+            response.raise_for_status()
+            return response
+
+        response = await self._retry_policy.run("issue_tracker/search", attempt)
+        found = {}
+        for data in response.json().get("issues", []):
+            issue = Issue.from_api(data)
+            found[issue.key] = issue
+        return found
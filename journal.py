@@ -0,0 +1,411 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Токен бота в URL Telegram и токены ReportPortal в журнал не попадают
+_BOT_TOKEN_RE = re.compile(r"/bot[^/]+/")
+_SECRET_FIELDS = ("access_token", "refresh_token")
+
+
+class JournalMismatch(LookupError):
+    """В журнале нет ответа на запрос, сделанный при воспроизведении"""
+
+
+def _redact_url(url):
+    return _BOT_TOKEN_RE.sub("/bot<token>/", url)
+
+
+def _encode_body(body):
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(record):
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    return record.get("body", "").encode("utf-8")
+
+
+def _read_state(path):
+    """Содержимое файла или каталога path: {относительный путь: тело}"""
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return {"": _encode_body(f.read())}
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            with open(full, "rb") as f:
+                files[os.path.relpath(full, path)] = _encode_body(f.read())
+    return files
+
+
+def _write_state(path, files):
+    for relative, record in files.items():
+        full = os.path.join(path, relative) if relative else path
+        os.makedirs(os.path.dirname(full) or ".", exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(_decode_body(record))
+
+
+def _is_token_request(url):
+    return url.path.endswith("/oauth/token")
+
+
+def _body_digest(request):
+    """Отпечаток тела запроса: POST-запросы на один адрес различаются телом
+
+    Для запроса токена отпечаток не считается: в теле логин и пароль, и по
+    хэшу без соли пароль можно подобрать. Такие запросы сопоставляются по
+    методу и пути.
+    """
+    if not request.content or _is_token_request(request.url):
+        return None
+    return hashlib.sha256(request.content).hexdigest()[:16]
+
+
+def _request_target(method, url, digest=None):
+    """Запрос без хоста: журнал воспроизводится и с другим адресом сервера"""
+    return method, httpx.URL(url).raw_path, digest
+
+
+def _request_shape(method, url):
+    """Запрос без значений параметров: для поиска ответа, если в URL есть время"""
+    url = httpx.URL(url)
+    return method, url.path, tuple(sorted(url.params.keys()))
+
+
+class JournalWriter:
+    """Запись журнала прогона в сжатый JSONL-файл
+
+    Записываются HTTP-обмены с ReportPortal и трекером задач (через
+    RecordingTransport), запросы к Telegram (через telegram_request) и записи
+    логов, в том числе о повторах запросов. У каждой записи - смещение t от
+    начала прогона и длительность elapsed.
+
+    state - {имя: путь к файлу или каталогу} локальных хранилищ и кэшей: их
+    содержимое на начало прогона сохраняется в журнал, чтобы воспроизведение
+    начиналось с того же состояния и делало те же запросы.
+    """
+
+    def __init__(self, path, mode, chat_id=None, state=None):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._handler = _JournalLogHandler(self)
+        self.record("start", started_at=datetime.now(timezone.utc).isoformat(), mode=mode, chat_id=chat_id)
+        if state is not None:
+            self.record("state", entries={name: _read_state(location) for name, location in state.items()
+                                          if location and os.path.exists(location)})
+        logging.getLogger().addHandler(self._handler)
+
+    def offset(self):
+        return time.perf_counter() - self._started
+
+    def record(self, kind, **fields):
+        line = json.dumps({"type": kind, "t": round(self.offset(), 6), **fields}, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def wrap(self, transport, service, base_url=None):
+        """Транспорт, записывающий обмен с service; base_url воспроизводится как есть"""
+        if base_url:
+            self.record("service", service=service, base_url=_redact_url(str(base_url)))
+        return RecordingTransport(transport, self, service)
+
+    def telegram_request(self):
+        return telegram_request(self)
+
+    def close(self):
+        logging.getLogger().removeHandler(self._handler)
+        self.record("end", elapsed=round(self.offset(), 6))
+        with self._lock:
+            self._file.close()
+        logger.info(f"Журнал прогона сохранен в {self.path}")
+
+
+class _JournalLogHandler(logging.Handler):
+    def __init__(self, journal):
+        super().__init__(logging.INFO)
+        self._journal = journal
+
+    def emit(self, record):
+        try:
+            self._journal.record("log", level=record.levelname, logger=record.name,
+                                 message=_redact_url(record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx, записывающий запросы и ответы в журнал"""
+
+    def __init__(self, transport, journal, service):
+        self._transport = transport
+        self._journal = journal
+        self._service = service
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        started = self._journal.offset()
+        base = {"service": self._service, "method": request.method, "url": _redact_url(str(request.url)),
+                "request_digest": _body_digest(request)}
+        try:
+            response = await self._transport.handle_async_request(request)
+            try:
+                body = b"".join([chunk async for chunk in response.stream])
+            finally:
+                await response.aclose()
+        except Exception as e:
+            self._journal.record("http", **base, started=round(started, 6),
+                                 elapsed=round(self._journal.offset() - started, 6),
+                                 error_type=type(e).__name__, error=str(e))
+            raise
+
+        headers = response.headers.multi_items()
+        recorded_headers, recorded_body = headers, body
+        if _is_token_request(request.url) and response.status_code == 200:
+            recorded_headers, recorded_body = self._redact_token(response.status_code, headers, body)
+        self._journal.record("http", **base, started=round(started, 6),
+                             elapsed=round(self._journal.offset() - started, 6),
+                             status=response.status_code, headers=recorded_headers, **_encode_body(recorded_body))
+        return httpx.Response(response.status_code, headers=headers, content=body,
+                              request=request, extensions=response.extensions)
+
+    @staticmethod
+    def _redact_token(status, headers, body):
+        """Ответ авторизации без токенов (тело распаковывается и сохраняется как есть)"""
+        try:
+            data = httpx.Response(status, headers=headers, content=body).json()
+        except ValueError:
+            return headers, b""
+        for field in _SECRET_FIELDS:
+            if field in data:
+                data[field] = "journal"
+        headers = [(key, value) for key, value in headers
+                   if key.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return headers, json.dumps(data).encode("utf-8")
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class JournalReplay:
+    """Воспроизведение журнала: ответы берутся из записи вместо сети
+
+    Ответ ищется по методу, пути, параметрам URL и телу запроса, а если
+    такого нет (в фильтрах есть текущее время) - по пути и набору
+    параметров, в порядке записи. Каждый ответ выдается после задержки
+    elapsed / speed; speed=0 - без задержек.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.header = {}
+        self.state = None
+        self._state_dir = None
+        http = defaultdict(list)
+        telegram = defaultdict(deque)
+        base_urls = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "start":
+                    self.header = record
+                elif record["type"] == "state":
+                    self.state = record["entries"]
+                elif record["type"] == "service":
+                    base_urls[record["service"]] = record["base_url"]
+                elif record["type"] == "http":
+                    http[record["service"]].append(record)
+                elif record["type"] == "telegram":
+                    telegram[record["method"]].append(record)
+        self._http = {service: _RecordedExchanges(records) for service, records in http.items()}
+        self._base_urls = {service: str(httpx.URL(records[0]["url"]).copy_with(raw_path=b"/")).rstrip("/")
+                           for service, records in http.items()}
+        self._base_urls.update(base_urls)
+        self._telegram = telegram
+        self.telegram_recorded = bool(telegram)
+        self.telegram_mismatches = 0
+
+    @property
+    def started_at(self):
+        return datetime.fromisoformat(self.header["started_at"])
+
+    @property
+    def mode(self):
+        return self.header.get("mode")
+
+    @property
+    def chat_id(self):
+        return self.header.get("chat_id")
+
+    def base_url(self, service):
+        """Адрес сервера service при записи или None, если обращений к нему не было"""
+        return self._base_urls.get(service)
+
+    def restore_state(self, names):
+        """Восстанавливаем хранилища и кэши на начало записанного прогона
+
+        Состояние разворачивается во временный каталог (удаляется в close).
+        Возвращает {имя: путь} для каждого имени из names; если в журнале нет
+        снимка или в нем нет этого хранилища, путь указывает на пустое место.
+        """
+        self._state_dir = tempfile.TemporaryDirectory(prefix="journal-state-")
+        paths = {name: os.path.join(self._state_dir.name, name) for name in names}
+        for name, files in (self.state or {}).items():
+            if name in paths:
+                _write_state(paths[name], files)
+        return paths
+
+    async def delay(self, record):
+        if self.speed and record.get("elapsed"):
+            await asyncio.sleep(record["elapsed"] / self.speed)
+
+    def wrap(self, transport, service, base_url=None):
+        return ReplayTransport(self, self._http.get(service) or _RecordedExchanges([]), service)
+
+    def telegram_request(self):
+        return telegram_request(self)
+
+    def take_telegram(self, method):
+        queue = self._telegram.get(method)
+        return queue.popleft() if queue else None
+
+    def close(self):
+        unused = sum(exchanges.unused() for exchanges in self._http.values())
+        unused += sum(len(queue) for queue in self._telegram.values())
+        if unused:
+            logger.warning(f"При воспроизведении {self.path} не использовано записанных запросов: {unused}")
+        if self.telegram_mismatches:
+            # Обычно это ссылки отчета: они строятся по текущему REPORTPORTAL_URL
+            logger.warning(f"Запросов Telegram, отличающихся от записанных в {self.path}: "
+                           f"{self.telegram_mismatches}")
+        if self._state_dir is not None:
+            self._state_dir.cleanup()
+
+
+class _RecordedExchanges:
+    def __init__(self, records):
+        self._records = records
+        self._used = set()
+        self._exact = defaultdict(deque)
+        self._similar = defaultdict(deque)
+        for index, record in enumerate(records):
+            self._exact[_request_target(record["method"], record["url"], record.get("request_digest"))].append(index)
+            self._similar[_request_shape(record["method"], record["url"])].append(index)
+
+    def take(self, method, url, digest=None):
+        for queue in (self._exact.get(_request_target(method, url, digest)),
+                      self._similar.get(_request_shape(method, url))):
+            while queue:
+                index = queue.popleft()
+                if index not in self._used:
+                    self._used.add(index)
+                    return self._records[index]
+        return None
+
+    def unused(self):
+        return len(self._records) - len(self._used)
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx, отвечающий записанными в журнал ответами"""
+
+    def __init__(self, replay, exchanges, service):
+        self._replay = replay
+        self._exchanges = exchanges
+        self._service = service
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        record = self._exchanges.take(request.method, _redact_url(str(request.url)), _body_digest(request))
+        if record is None:
+            raise JournalMismatch(f"В журнале нет ответа {self._service} на {request.method} {request.url}")
+        await self._replay.delay(record)
+        if "error_type" in record:
+            error_class = getattr(httpx, record["error_type"], httpx.TransportError)
+            raise error_class(record["error"], request=request)
+        return httpx.Response(record["status"], headers=record["headers"], content=_decode_body(record),
+                              request=request)
+
+
+def telegram_request(journal):
+    """Объект запросов python-telegram-bot, пишущий в журнал или читающий из него
+
+    Класс создается при вызове, чтобы модуль не импортировал python-telegram-bot.
+    """
+    import telegram.error
+    from telegram.request import BaseRequest, HTTPXRequest
+
+    class JournalRequest(BaseRequest):
+        def __init__(self):
+            self._inner = HTTPXRequest() if isinstance(journal, JournalWriter) else None
+
+        async def initialize(self):
+            if self._inner is not None:
+                await self._inner.initialize()
+
+        async def shutdown(self):
+            if self._inner is not None:
+                await self._inner.shutdown()
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                             connect_timeout=None, pool_timeout=None):
+            api_method = url.rsplit("/", 1)[-1]
+            parameters = request_data.parameters if request_data is not None else None
+            if self._inner is None:
+                return await self._replay(api_method, parameters)
+
+            started = journal.offset()
+            base = {"method": api_method, "url": _redact_url(url), "parameters": parameters}
+            try:
+                status, payload = await self._inner.do_request(
+                    url, method, request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                    connect_timeout=connect_timeout, pool_timeout=pool_timeout
+                )
+            except telegram.error.TelegramError as e:
+                journal.record("telegram", **base, started=round(started, 6),
+                               elapsed=round(journal.offset() - started, 6),
+                               error_type=type(e).__name__, error=e.message,
+                               retry_after=getattr(e, "retry_after", None))
+                raise
+            journal.record("telegram", **base, started=round(started, 6), elapsed=round(journal.offset() - started, 6),
+                           status=status, payload=payload.decode("utf-8", "replace"))
+            return status, payload
+
+        async def _replay(self, api_method, parameters):
+            record = journal.take_telegram(api_method)
+            if record is None:
+                raise JournalMismatch(f"В журнале нет ответа Telegram на {api_method}")
+            await journal.delay(record)
+            if parameters is not None and record.get("parameters") != json.loads(json.dumps(parameters, default=str)):
+                journal.telegram_mismatches += 1
+                logger.debug(f"Запрос Telegram {api_method} отличается от записанного в журнале")
+            if record.get("retry_after") is not None:
+                raise telegram.error.RetryAfter(record["retry_after"])
+            if "error_type" in record:
+                error_class = getattr(telegram.error, record["error_type"], telegram.error.NetworkError)
+                raise error_class(record["error"])
+            return record["status"], record["payload"].encode("utf-8")
+
+    return JournalRequest()
@@ -0,0 +1,219 @@
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Поля завершенного запуска, которые меняются при разборе дефектов после его окончания
+TRIAGE_FIELDS = ("lastModified", "statistics")
+
+
+def parse_start_time(value):
+    """Переводим startTime ReportPortal (ISO-строка или миллисекунды) в datetime UTC"""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class LaunchStore:
+    """Локальное хранилище запусков ReportPortal на SQLite
+
+    Запуски хранятся по ключу (project, id). Завершенные запуски помечаются
+    неизменяемыми и больше не перезаписываются, поэтому повторная синхронизация
+    запрашивает у сервера только новые запуски и те, что еще выполняются.
+    Исключение - поля разбора дефектов (TRIAGE_FIELDS): их для попавших в
+    отчет запусков обновляет refresh_triage.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Запросы к хранилищу выполняются из пула потоков, поэтому соединение
+        # разделяется между потоками и защищается блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS launches (
+                project TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                start_ts REAL NOT NULL,
+                status TEXT,
+                immutable INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL,
+                PRIMARY KEY (project, id)
+            );
+            CREATE INDEX IF NOT EXISTS launches_project_start ON launches (project, start_ts);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                project TEXT NOT NULL,
+                sync_key TEXT NOT NULL,
+                high_water_mark REAL NOT NULL,
+                PRIMARY KEY (project, sync_key)
+            );
+            -- Наблюдение ведется по разделам отчета: один проект может быть
+            -- в нескольких разделах
+            CREATE TABLE IF NOT EXISTS notifications (
+                section TEXT NOT NULL,
+                project TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                notified_at REAL NOT NULL,
+                PRIMARY KEY (section, project, id)
+            );
+            CREATE TABLE IF NOT EXISTS watch_state (
+                section TEXT PRIMARY KEY,
+                started_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def high_water_mark(self, project, sync_key=""):
+        """Время начала самого свежего запуска, полученного синхронизацией с ключом sync_key
+
+        Ключ отличает синхронизации с разными серверными фильтрами: каждая из них
+        видит свое подмножество запусков проекта.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT high_water_mark FROM sync_state WHERE project = ? AND sync_key = ?", (project, sync_key)
+            ).fetchone()
+        if row is None:
+            return None
+        return datetime.fromtimestamp(row[0], tz=timezone.utc)
+
+    def mutable_ids(self, project, since):
+        """ID сохраненных запусков, которые еще не завершились"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM launches WHERE project = ? AND immutable = 0 AND start_ts > ?",
+                (project, since.timestamp())
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def upsert(self, project, launches, sync_key=None):
+        """Сохраняем запуски, не трогая уже завершенные
+
+        Если передан sync_key, high-water mark этой синхронизации сдвигается
+        на время начала самого свежего из сохраненных запусков.
+        """
+        rows = [
+            (
+                project,
+                launch["id"],
+                parse_start_time(launch["startTime"]).timestamp(),
+                launch.get("status"),
+                int(launch.get("status") != "IN_PROGRESS"),
+                json.dumps(launch, ensure_ascii=False)
+            )
+            for launch in launches
+        ]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO launches (project, id, start_ts, status, immutable, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (project, id) DO UPDATE SET
+                    start_ts = excluded.start_ts,
+                    status = excluded.status,
+                    immutable = excluded.immutable,
+                    data = excluded.data
+                WHERE launches.immutable = 0
+            """, rows)
+            if sync_key is not None and rows:
+                self._conn.execute("""
+                    INSERT INTO sync_state (project, sync_key, high_water_mark)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (project, sync_key) DO UPDATE SET
+                        high_water_mark = MAX(high_water_mark, excluded.high_water_mark)
+                """, (project, sync_key, max(row[2] for row in rows)))
+            self._conn.commit()
+        return len(rows)
+
+    def refresh_triage(self, project, launches):
+        """Обновляем у завершенных запусков только поля разбора дефектов
+
+        launches - данные запусков, перечитанные с сервера. Остальные поля
+        завершенного запуска не перезаписываются. Возвращает сохраненные
+        данные обновленных запусков (незавершенных и отсутствующих в
+        хранилище среди них нет).
+        """
+        stored = []
+        with self._lock:
+            for launch in launches:
+                row = self._conn.execute(
+                    "SELECT data FROM launches WHERE project = ? AND id = ? AND immutable = 1",
+                    (project, launch["id"])
+                ).fetchone()
+                if row is None:
+                    continue
+                data = json.loads(row[0])
+                changed = {field: launch[field] for field in TRIAGE_FIELDS
+                           if field in launch and data.get(field) != launch[field]}
+                if changed:
+                    data.update(changed)
+                    self._conn.execute(
+                        "UPDATE launches SET data = ? WHERE project = ? AND id = ?",
+                        (json.dumps(data, ensure_ascii=False), project, launch["id"])
+                    )
+                stored.append(data)
+            self._conn.commit()
+        return stored
+
+    def launches_since(self, project, since):
+        """Запуски проекта, начавшиеся после since, от новых к старым"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM launches WHERE project = ? AND start_ts > ? ORDER BY start_ts DESC, id DESC",
+                (project, since.timestamp())
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def start_watching(self, section):
+        """Отмечаем начало наблюдения за разделом отчета
+
+        Возвращает True, если наблюдение за разделом начинается впервые.
+        """
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO watch_state (section, started_at) VALUES (?, ?)",
+                (section, datetime.now(timezone.utc).timestamp())
+            ).rowcount
+            self._conn.commit()
+        return bool(inserted)
+
+    def claim_notifications(self, section, project, ids):
+        """Отмечаем запуски раздела как отправленные и возвращаем те, что еще не отправлялись
+
+        Отметка ставится до отправки, поэтому уведомление об одном запуске не
+        может уйти дважды, даже если бот перезапустится посреди отправки.
+        """
+        now = datetime.now(timezone.utc).timestamp()
+        claimed = []
+        with self._lock:
+            for launch_id in ids:
+                if self._conn.execute(
+                    "INSERT OR IGNORE INTO notifications (section, project, id, notified_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (section, project, launch_id, now)
+                ).rowcount:
+                    claimed.append(launch_id)
+            self._conn.commit()
+        return claimed
+
+    def prune(self, before):
+        """Удаляем запуски, начавшиеся раньше before"""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM launches WHERE start_ts < ?", (before.timestamp(),)
+            ).rowcount
+            # Отметки об уведомлениях хранятся дольше самих запусков: запуск
+            # мог начаться раньше окна хранения, а завершиться недавно
+            self._conn.execute(
+                "DELETE FROM notifications WHERE notified_at < ?", (before.timestamp(),)
+            )
+            self._conn.commit()
+        if deleted:
+            logger.info(f"Из хранилища запусков удалено {deleted} устаревших записей")
+        return deleted
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "report_bot"
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels_key):
+    if not labels_key:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels_key) + "}"
+
+
+class Metrics:
+    """Таймеры и счетчики этапов отчета
+
+    Таймеры (span/observe) копят число вызовов, суммарное и максимальное время,
+    счетчики (inc) - целые значения. Метрики различаются именем и набором меток,
+    выгружаются в формате Prometheus или в виде JSON-сводки.
+    """
+
+    def __init__(self):
+        self._timers = defaultdict(lambda: [0, 0.0, 0.0])
+        self._counters = defaultdict(int)
+
+    def reset(self):
+        self._timers.clear()
+        self._counters.clear()
+
+    def observe(self, name, seconds, **labels):
+        timer = self._timers[(name, _labels_key(labels))]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+    def inc(self, name, value=1, **labels):
+        self._counters[(name, _labels_key(labels))] += value
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Замеряем время блока; при исключении вызов учитывается с меткой error"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(name, time.perf_counter() - started, **labels, outcome="error")
+            raise
+        self.observe(name, time.perf_counter() - started, **labels, outcome="ok")
+
+    def summary(self):
+        """JSON-совместимая сводка по всем метрикам"""
+        timers = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": count,
+                "total_seconds": round(total, 4),
+                "max_seconds": round(maximum, 4),
+            }
+            for (name, labels), (count, total, maximum) in sorted(self._timers.items())
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(self._counters.items())
+        ]
+        return {"timers": timers, "counters": counters}
+
+    def render_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        timer_names = sorted({name for name, _ in self._timers})
+        for name in timer_names:
+            metric = f"{METRIC_PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (timer_name, labels), (count, total, maximum) in sorted(self._timers.items()):
+                if timer_name != name:
+                    continue
+                lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            for (timer_name, labels), (_, _, maximum) in sorted(self._timers.items()):
+                if timer_name == name:
+                    lines.append(f"{metric}_max{_format_labels(labels)} {maximum:.6f}")
+
+        counter_names = sorted({name for name, _ in self._counters})
+        for name in counter_names:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(self._counters.items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """Сохраняем JSON-сводку в файл"""
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить метрики в {path}: {e}")
+
+    def log_summary(self):
+        """Выводим в лог время этапов, отсортированное по суммарной длительности"""
+        for timer in sorted(self.summary()["timers"], key=lambda timer: -timer["total_seconds"]):
+            labels = ", ".join(f"{key}={value}" for key, value in timer["labels"].items())
+            logger.info(f"Метрика {timer['name']} [{labels}]: вызовов {timer['count']}, "
+                        f"всего {timer['total_seconds']} с, максимум {timer['max_seconds']} с")
+        for counter in self.summary()["counters"]:
+            labels = ", ".join(f"{key}={value}" for key, value in counter["labels"].items())
+            logger.info(f"Счетчик {counter['name']} [{labels}]: {counter['value']}")
+
+
+def timed(name, **labels):
+    """Декоратор корутины: время каждого вызова учитывается таймером name"""
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with METRICS.span(name, **labels):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def start_metrics_server(metrics, port, host="0.0.0.0"):
+    """HTTP-endpoint /metrics в формате Prometheus"""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Заголовки запроса не нужны, но их нужно дочитать
+            while (await reader.readline()).strip():
+                pass
+            path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+            if path.split("?")[0] == "/metrics":
+                status, body = "200 OK", metrics.render_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики Prometheus доступны на http://{host}:{port}/metrics")
+    return server
+
+
+METRICS = Metrics()
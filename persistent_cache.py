@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentLRU:
+    """LRU-словарь записей с необязательным временем жизни
+
+    Записи - JSON-совместимые словари. Запись, сохраненная с ttl, получает
+    поле expires_at и перестает выдаваться после его наступления. Размер
+    ограничен max_entries, содержимое может сохраняться в JSON-файл между
+    запусками бота: порядок в файле - от давно использованных к недавним.
+    clock - источник текущего времени для сроков жизни записей.
+    """
+
+    def __init__(self, max_entries, cache_file=None, name="кэш", clock=time.time):
+        self._clock = clock
+        self._max_entries = max_entries
+        self._cache_file = cache_file
+        self._name = name
+        self._entries = OrderedDict()
+        self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Действующая запись или None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry, ttl=None):
+        """Сохраняем запись; с ttl она действительна ttl секунд"""
+        if ttl is not None:
+            entry = {**entry, "expires_at": self._clock() + ttl}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self):
+        if not self._cache_file or not os.path.exists(self._cache_file):
+            return
+        try:
+            with open(self._cache_file, encoding="utf-8") as f:
+                entries = json.load(f)
+            now = self._clock()
+            for key, entry in entries[-self._max_entries:]:
+                expires_at = entry.get("expires_at")
+                if expires_at is None or expires_at > now:
+                    self._entries[key] = entry
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Не удалось прочитать {self._name} {self._cache_file}: {e}")
+
+    def save(self):
+        if not self._cache_file:
+            return
+        try:
+            with open(self._cache_file, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить {self._name} {self._cache_file}: {e}")
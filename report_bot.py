@@ -0,0 +1,1858 @@
+"""Сборка отчетов ReportPortal и их доставка в Telegram
+
+Модуль не читает обязательные переменные окружения при импорте и не
+импортирует python-telegram-bot и pytz: они загружаются только в функциях,
+которые работают с Telegram. Запуск из командной строки - через main.py.
+"""
+from __future__ import annotations
+
+import httpx
+import logging
+from datetime import datetime, time
+import os
+from dotenv import load_dotenv
+import asyncio
+from datetime import datetime, timedelta, timezone
+import hashlib
+import html
+import json
+import time as time_module
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+from http_cache import CachingTransport, HttpCache, parse_freshness
+from journal import JournalReplay, JournalWriter
+from issue_tracker import STATUS_CATEGORY_ORDER, IssueCache, IssueTracker
+from launch_store import LaunchStore, parse_start_time
+from metrics import METRICS, start_metrics_server, timed
+from persistent_cache import PersistentLRU
+from report_config import load_report_config
+from sharding import run_sharded, shard_by
+from sinks import HtmlFileSink, JsonFileSink, StdoutSink, TelegramSink, publish
+from retry import RetryPolicy, request_timeout, retry_scope
+from telegram_sender import TelegramSender
+from trend_store import TrendStore
+
+try:
+    import ijson
+except ImportError:  # без ijson страницы разбираются целиком через json
+    ijson = None
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import CallbackContext, ContextTypes
+
+# Конфигурация
+load_dotenv()
+
+# Обязательные переменные окружения: для доступа к ReportPortal и для Telegram.
+# Проверяются при запуске команды (check_required_env), а не при импорте
+REPORTPORTAL_ENV_VARS = ("REPORT_PORTAL_USERNAME", "REPORT_PORTAL_PASSWORD")
+TELEGRAM_ENV_VARS = ("TELEGRAM_TOKEN", "TELEGRAM_CHAT_ID")
+
+REPORTPORTAL_URL = os.getenv("REPORTPORTAL_URL", "https://reportportal.a2nta.ru")
+AUTH_URL = f"{REPORTPORTAL_URL}/uat/sso/oauth/token"
+AUTH_HEADERS = {
+    "Authorization": "Basic dWk6dWltYW4=",
+    "Accept": "application/json, text/plain, */*",
+    "Content-Type": "application/x-www-form-urlencoded"
+}
+AUTH_DATA = {
+    "grant_type": "password",
+    "username": os.getenv("REPORT_PORTAL_USERNAME"),
+    "password": os.getenv("REPORT_PORTAL_PASSWORD")
+}
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_CHAT_ID = int(os.getenv("TELEGRAM_CHAT_ID") or 0)  # Конвертируем в число
+
+# Описание отчета: проекты, фильтры запусков и группировка
+REPORT_CONFIG_PATH = os.getenv("REPORT_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "report.toml"))
+
+# Наблюдение за завершением запусков (--watch): границы адаптивного интервала
+# опроса в секундах и чат для уведомлений
+WATCH_MIN_INTERVAL = float(os.getenv("WATCH_MIN_INTERVAL", "30"))
+WATCH_MAX_INTERVAL = float(os.getenv("WATCH_MAX_INTERVAL", "600"))
+WATCH_CHAT_ID = int(os.getenv("WATCH_CHAT_ID") or TELEGRAM_CHAT_ID)
+
+# Метрики: JSON-сводка по итогам разового запуска и порт endpoint /metrics для --serve
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Время ежедневного отчета в режиме постоянно работающего бота
+DAILY_REPORT_TIME = os.getenv("DAILY_REPORT_TIME", "08:00")
+REPORT_TIMEZONE = os.getenv("REPORT_TIMEZONE", "Europe/Moscow")
+
+# Ограничения скорости отправки в Telegram (сообщений в минуту на чат и допустимый всплеск)
+TELEGRAM_GROUP_RATE_PER_MINUTE = int(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+TELEGRAM_PRIVATE_RATE_PER_MINUTE = int(os.getenv("TELEGRAM_PRIVATE_RATE_PER_MINUTE", "60"))
+TELEGRAM_BURST = int(os.getenv("TELEGRAM_BURST", "3"))
+
+# Время, в течение которого собранный отчет раздается повторным запросам /report
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "60"))
+# Период фонового обновления снимка отчета, из которого бот сразу отвечает на
+# /report (секунды, 0 - снимок не обновляется и /report собирает отчет)
+REPORT_SNAPSHOT_INTERVAL = int(os.getenv("REPORT_SNAPSHOT_INTERVAL", "900"))
+
+# Параметры пула соединений с ReportPortal
+RP_MAX_CONNECTIONS = int(os.getenv("RP_MAX_CONNECTIONS", "20"))
+RP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("RP_MAX_CONNECTIONS_PER_HOST", "10"))
+RP_KEEPALIVE_EXPIRY = float(os.getenv("RP_KEEPALIVE_EXPIRY", "30"))
+RP_TIMEOUT = float(os.getenv("RP_TIMEOUT", "60"))
+RP_CONNECT_TIMEOUT = float(os.getenv("RP_CONNECT_TIMEOUT", "10"))
+# Размер страницы /item/v2: чем больше, тем меньше запросов (300 - максимум ReportPortal)
+ITEM_PAGE_SIZE = int(os.getenv("ITEM_PAGE_SIZE", "300"))
+# Максимальное число одновременно загружаемых страниц с дефектами
+DEFECT_FETCH_CONCURRENCY = int(os.getenv("DEFECT_FETCH_CONCURRENCY", "8"))
+
+# Шардированная сборка больших отчетов: прогоны делятся на шарды по проекту и
+# ветке и обрабатываются REPORT_SHARD_WORKERS обработчиками через очередь на
+# REPORT_SHARD_QUEUE_SIZE шардов. 0 - все прогоны запрашиваются одновременно
+REPORT_SHARD_WORKERS = int(os.getenv("REPORT_SHARD_WORKERS", "0"))
+REPORT_SHARD_QUEUE_SIZE = int(os.getenv("REPORT_SHARD_QUEUE_SIZE", "16"))
+
+# Дисковый кэш GET-ответов ReportPortal (пустой HTTP_CACHE_DIR отключает): предельный
+# размер и свежесть по endpoint - сколько секунд ответ отдается без перепроверки
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "http_cache")
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "256")) * 1024 * 1024
+HTTP_CACHE_FRESHNESS = os.getenv("HTTP_CACHE_FRESHNESS", "launch=0,item/v2=0")
+
+# Локальное хранилище запусков
+LAUNCH_STORE_PATH = os.getenv("LAUNCH_STORE_PATH", "launches.db")
+LAUNCH_STORE_RETENTION_DAYS = int(os.getenv("LAUNCH_STORE_RETENTION_DAYS", "14"))
+LAUNCH_PAGE_SIZE = int(os.getenv("LAUNCH_PAGE_SIZE", "100"))
+# Сколько ID запусков передается в одном запросе filter.in.id
+LAUNCH_ID_CHUNK_SIZE = int(os.getenv("LAUNCH_ID_CHUNK_SIZE", "50"))
+
+# Кэш ссылок на дефекты по завершенным запускам
+DEFECT_CACHE_FILE = os.getenv("DEFECT_CACHE_FILE", "defect_cache.json")
+DEFECT_CACHE_SIZE = int(os.getenv("DEFECT_CACHE_SIZE", "500"))
+
+# Сравнение упавших тестов с предыдущим запуском: кэш списков по завершенным
+# запускам и сколько названий тестов выводить в отчете
+FAILED_ITEMS_CACHE_FILE = os.getenv("FAILED_ITEMS_CACHE_FILE", "failed_items_cache.json")
+FAILED_ITEMS_CACHE_SIZE = int(os.getenv("FAILED_ITEMS_CACHE_SIZE", "100"))
+FAILED_DIFF_LIST_LIMIT = int(os.getenv("FAILED_DIFF_LIST_LIMIT", "20"))
+
+# Трекер задач для статусов дефектов (по умолчанию отключен: без токена
+# Jira не отдает задачи), размер пачки ключей в одном поиске и кэш задач:
+# время жизни найденных и отсутствующих в трекере задач
+ISSUE_TRACKER_URL = os.getenv("ISSUE_TRACKER_URL", "")
+ISSUE_TRACKER_TOKEN = os.getenv("ISSUE_TRACKER_TOKEN")
+ISSUE_BATCH_SIZE = int(os.getenv("ISSUE_BATCH_SIZE", "50"))
+ISSUE_FETCH_CONCURRENCY = int(os.getenv("ISSUE_FETCH_CONCURRENCY", "4"))
+ISSUE_CACHE_FILE = os.getenv("ISSUE_CACHE_FILE", "issue_cache.json")
+ISSUE_CACHE_SIZE = int(os.getenv("ISSUE_CACHE_SIZE", "2000"))
+ISSUE_CACHE_TTL = int(os.getenv("ISSUE_CACHE_TTL", "900"))
+ISSUE_NEGATIVE_CACHE_TTL = int(os.getenv("ISSUE_NEGATIVE_CACHE_TTL", "3600"))
+
+# История запусков для отчета о трендах: файл, период сравнения и срок хранения
+TREND_STORE_PATH = os.getenv("TREND_STORE_PATH", "trend.db")
+TREND_PERIOD_DAYS = int(os.getenv("TREND_PERIOD_DAYS", "7"))
+TREND_RETENTION_DAYS = int(os.getenv("TREND_RETENTION_DAYS", "180"))
+
+# Кэш access_token: файл (необязательно) и запас времени до истечения срока действия
+TOKEN_CACHE_FILE = os.getenv("TOKEN_CACHE_FILE")
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+
+# Локальные хранилища и кэши, которые можно сохранить в журнал прогона
+JOURNAL_STATE_NAMES = ("launch_store", "trend_store", "http_cache", "defect_cache", "failed_items_cache",
+                       "issue_cache")
+
+# Сетевые ошибки, при которых запрос к ReportPortal имеет смысл повторить
+RP_RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError)
+
+# Повторы запросов к ReportPortal: число попыток и границы задержки (full jitter)
+RP_RETRY_ATTEMPTS = int(os.getenv("RP_RETRY_ATTEMPTS", "3"))
+RP_RETRY_BASE_DELAY = float(os.getenv("RP_RETRY_BASE_DELAY", "1"))
+RP_RETRY_MAX_DELAY = float(os.getenv("RP_RETRY_MAX_DELAY", "30"))
+# Размыкатель: после стольких ошибок подряд endpoint отключается на RP_BREAKER_RESET секунд
+RP_BREAKER_THRESHOLD = int(os.getenv("RP_BREAKER_THRESHOLD", "5"))
+RP_BREAKER_RESET = float(os.getenv("RP_BREAKER_RESET", "30"))
+# Общее время на сборку одного отчета и общий на отчет запас повторов
+REPORT_DEADLINE = float(os.getenv("REPORT_DEADLINE", "300"))
+REPORT_RETRY_BUDGET = int(os.getenv("REPORT_RETRY_BUDGET", "20"))
+
+# Настройка логирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+_report_config = None
+
+# Сдвиг часов отчета: при воспроизведении журнала окна запусков отсчитываются
+# от момента записи, а не от текущего времени
+_clock_offset = timedelta(0)
+
+
+def utc_now():
+    """Текущее время UTC для окон отчета (с учетом сдвига при воспроизведении)"""
+    return datetime.now(timezone.utc) + _clock_offset
+
+
+def utc_timestamp():
+    """utc_now() в секундах: часы кэшей, чтобы при воспроизведении сроки
+    жизни записей отсчитывались от момента записи"""
+    return utc_now().timestamp()
+
+
+def set_report_clock(moment):
+    """Переводим часы отчета на moment"""
+    global _clock_offset
+    _clock_offset = moment - datetime.now(timezone.utc)
+
+
+def check_required_env(names):
+    """Проверяем, что заданы переменные окружения names; недостающие пишем в лог"""
+    missing = [name for name in names if not os.getenv(name)]
+    for name in missing:
+        logger.error(f"Отсутствует обязательная переменная окружения: {name}")
+    return not missing
+
+
+def get_report_config():
+    """Описание отчета из REPORT_CONFIG_PATH, загружается при первом обращении"""
+    global _report_config
+    if _report_config is None:
+        _report_config = load_report_config(REPORT_CONFIG_PATH)
+    return _report_config
+
+
+class AsyncByteReader:
+    """Адаптер асинхронного потока байтов к файловому интерфейсу для ijson
+
+    Запоминает последние tail_size байт потока: метаданные пагинации
+    ReportPortal идут после списка content и берутся из этого хвоста.
+    """
+
+    def __init__(self, chunks, tail_size=4096):
+        self._chunks = chunks.__aiter__()
+        self._buffer = b""
+        self._tail_size = tail_size
+        self.tail = b""
+
+    async def read(self, size=-1):
+        if not self._buffer:
+            try:
+                self._buffer = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+            self.tail = (self.tail + self._buffer)[-self._tail_size:]
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    async def drain(self):
+        """Дочитываем поток до конца (обновляя хвост)"""
+        while await self.read(65536):
+            pass
+
+
+def parse_page_metadata(tail):
+    """Извлекаем объект "page" из хвоста ответа ReportPortal"""
+    start = tail.rfind(b'"page"')
+    if start < 0:
+        raise ValueError("В ответе ReportPortal не найдены метаданные пагинации")
+    text = tail[tail.index(b"{", start):].decode("utf-8")
+    return json.JSONDecoder().raw_decode(text)[0]
+
+
+async def parse_item_page(chunks, fields, nested=None):
+    """Потоковый разбор страницы /item/v2 за один проход
+
+    Из каждого теста (или его вложенного объекта nested, например issue)
+    извлекаются только значения полей fields и метаданные пагинации. Тесты
+    целиком не материализуются: ijson собирает только нужные объекты, поэтому
+    память не растет с размером страницы. Возвращает ([кортежи fields], page).
+    """
+    if ijson is None:
+        data = json.loads(b"".join([chunk async for chunk in chunks]))
+        objects = [(item.get(nested) if nested else item) for item in data.get("content", [])]
+        return [tuple((obj or {}).get(name) for name in fields) for obj in objects], data.get("page", {})
+
+    reader = AsyncByteReader(chunks)
+    prefix = f"content.item.{nested}" if nested else "content.item"
+    values = [
+        tuple((obj or {}).get(name) for name in fields)
+        async for obj in ijson.items_async(reader, prefix)
+    ]
+    await reader.drain()
+    return values, parse_page_metadata(reader.tail)
+
+
+# Пары (issueType, comment) дефектов тестов и (uniqueId, name) упавших тестов
+parse_issue_page = partial(parse_item_page, fields=("issueType", "comment"), nested="issue")
+parse_failed_items_page = partial(parse_item_page, fields=("uniqueId", "name"))
+
+
+@dataclass(slots=True)
+class LaunchStatistics:
+    """Статистика выполнения тестов запуска"""
+    total: int = 0
+    passed: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+    @classmethod
+    def from_api(cls, statistics):
+        executions = (statistics or {}).get("executions", {})
+        return cls(
+            total=executions.get("total", 0),
+            passed=executions.get("passed", 0),
+            failed=executions.get("failed", 0),
+            skipped=executions.get("skipped", 0)
+        )
+
+
+@dataclass(slots=True)
+class Launch:
+    """Разобранный запуск ReportPortal
+
+    Строится один раз из ответа API: атрибуты собираются в словарь, время
+    начала разбирается заранее, поэтому фильтрация, выбор последнего запуска
+    и форматирование не сканируют список атрибутов повторно.
+    """
+    id: int
+    project: str
+    name: str
+    number: int
+    status: str
+    start_time: datetime
+    start_time_raw: str
+    attributes: dict
+    statistics: LaunchStatistics
+    fingerprint: str = None
+
+    @classmethod
+    def from_api(cls, data, project):
+        attributes = {}
+        for attr in data.get("attributes", []):
+            attributes[attr.get("key")] = attr.get("value")
+        return cls(
+            id=data.get("id"),
+            project=project,
+            name=data.get("name"),
+            number=data.get("number"),
+            status=data.get("status"),
+            start_time=parse_start_time(data["startTime"]),
+            start_time_raw=data.get("startTime"),
+            attributes=attributes,
+            statistics=LaunchStatistics.from_api(data.get("statistics")),
+            fingerprint=launch_fingerprint(data)
+        )
+
+    @property
+    def branch(self):
+        return self.attributes.get("Branch name") or self.attributes.get("Branch")
+
+    @property
+    def commit_hash(self):
+        return self.attributes.get("Commit hash")
+
+
+@dataclass(slots=True)
+class FailedDiff:
+    """Сравнение упавших тестов запуска с предыдущим запуском той же ветки
+
+    new, fixed и persistent - названия тестов по алфавиту; previous - запуск,
+    с которым сравнивали, или None, если его не нашлось (тогда все упавшие
+    тесты попадают в new).
+    """
+    previous: Launch
+    new: list
+    fixed: list
+    persistent: list
+
+
+def diff_failed_items(current, previous):
+    """Сравниваем словари {uniqueId: name} упавших тестов двух запусков
+
+    Возвращает (новые падения, исправленные, падающие повторно).
+    """
+    current_ids = current.keys()
+    previous_ids = previous.keys()
+    return (
+        sorted(current[unique_id] for unique_id in current_ids - previous_ids),
+        sorted(previous[unique_id] for unique_id in previous_ids - current_ids),
+        sorted(current[unique_id] for unique_id in current_ids & previous_ids)
+    )
+
+
+class TokenManager:
+    """Кэш access_token ReportPortal с обновлением до истечения срока действия
+
+    Токен хранится в памяти и, если задан cache_file, в файле с правами 0600.
+    Обновление выполняется через refresh_token (при неудаче - по паролю), а
+    одновременные вызовы ждут одно и то же обновление.
+    """
+
+    def __init__(self, request, cache_file=TOKEN_CACHE_FILE, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self._request = request
+        self._cache_file = cache_file
+        self._refresh_margin = refresh_margin
+        self._access_token = None
+        self._refresh_token = None
+        self._expires_at = 0
+        self._refresh_task = None
+        self._load()
+
+    def _is_fresh(self):
+        return bool(self._access_token) and time_module.time() < self._expires_at - self._refresh_margin
+
+    async def get_token(self):
+        """Возвращаем действующий токен, при необходимости обновляя его"""
+        if self._is_fresh():
+            METRICS.inc("token_cache", result="hit")
+            return self._access_token
+
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            self._refresh_task.add_done_callback(self._reset_refresh_task)
+        # shield: отмена одного из ожидающих не должна прерывать общее обновление
+        return await asyncio.shield(self._refresh_task)
+
+    def _reset_refresh_task(self, task):
+        self._refresh_task = None
+        if not task.cancelled():
+            # Исключение получат ожидающие вызовы, здесь лишь помечаем его обработанным
+            task.exception()
+
+    def invalidate(self, token):
+        """Сбрасываем токен, отвергнутый сервером (401)"""
+        if token == self._access_token:
+            self._access_token = None
+            self._expires_at = 0
+
+    @timed("token_refresh")
+    async def _refresh(self):
+        if self._refresh_token:
+            try:
+                data = await self._request_token({
+                    "grant_type": "refresh_token",
+                    "refresh_token": self._refresh_token
+                })
+                logger.info("Токен обновлен через refresh_token")
+                return self._store(data)
+            except httpx.HTTPStatusError as e:
+                logger.warning(f"Не удалось обновить токен через refresh_token: {e}")
+                self._refresh_token = None
+
+        data = await self._request_token(AUTH_DATA)
+        logger.info("Получен новый токен")
+        return self._store(data)
+
+    async def _request_token(self, data):
+        try:
+            response = await self._request("POST", AUTH_URL, headers=AUTH_HEADERS, data=data)
+            return response.json()
+        except Exception as e:
+            logger.error(f"Ошибка при получении токена: {str(e)}")
+            raise
+
+    def _store(self, data):
+        self._access_token = data.get("access_token")
+        self._refresh_token = data.get("refresh_token") or self._refresh_token
+        self._expires_at = time_module.time() + int(data.get("expires_in", 0))
+        self._save()
+        return self._access_token
+
+    def _load(self):
+        if not self._cache_file or not os.path.exists(self._cache_file):
+            return
+        try:
+            with open(self._cache_file, encoding="utf-8") as f:
+                data = json.load(f)
+            self._access_token = data.get("access_token")
+            self._refresh_token = data.get("refresh_token")
+            self._expires_at = data.get("expires_at", 0)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать кэш токена {self._cache_file}: {e}")
+
+    def _save(self):
+        if not self._cache_file:
+            return
+        data = {
+            "access_token": self._access_token,
+            "refresh_token": self._refresh_token,
+            "expires_at": self._expires_at
+        }
+        try:
+            # Файл создается сразу с правами 0600, чтобы токен не был доступен другим пользователям
+            fd = os.open(self._cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.chmod(self._cache_file, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш токена {self._cache_file}: {e}")
+
+
+def launch_fingerprint(launch):
+    """Отпечаток состояния запуска: меняется при любом изменении разбора дефектов
+
+    Для незавершенных запусков возвращается None - их дефекты не кэшируются.
+    """
+    if launch.get("status") == "IN_PROGRESS":
+        return None
+    state = json.dumps([launch.get("lastModified"), launch.get("statistics")], sort_keys=True)
+    return hashlib.sha1(state.encode("utf-8")).hexdigest()
+
+
+class DefectCache:
+    """LRU-кэш ссылок на дефекты по ключу (project, launch_id)
+
+    Запись действительна, пока совпадает отпечаток запуска (lastModified и
+    статистика). Размер ограничен max_entries, содержимое может сохраняться
+    в JSON-файл между запусками бота.
+    """
+
+    def __init__(self, max_entries=DEFECT_CACHE_SIZE, cache_file=DEFECT_CACHE_FILE, name="кэш дефектов"):
+        self._entries = PersistentLRU(max_entries, cache_file, name)
+
+    @staticmethod
+    def _key(project, launch_id):
+        return f"{project}:{launch_id}"
+
+    def get(self, project, launch_id, fingerprint):
+        """Возвращаем закэшированные ссылки или None, если запуск изменился"""
+        entry = self._entries.get(self._key(project, launch_id))
+        if entry is None or fingerprint is None or entry["fingerprint"] != fingerprint:
+            return None
+        return list(entry["links"])
+
+    def put(self, project, launch_id, fingerprint, links):
+        if fingerprint is None:
+            return
+        self._entries.put(self._key(project, launch_id), {"fingerprint": fingerprint, "links": list(links)})
+
+    def save(self):
+        self._entries.save()
+
+
+class ReportPortalClient:
+    """Асинхронный клиент ReportPortal с общим пулом keep-alive соединений
+
+    Один экземпляр переиспользуется для всех запросов отчета: TCP/TLS-соединения
+    открываются один раз, а число одновременных запросов к одному хосту
+    ограничено семафором.
+    """
+
+    def __init__(self, base_url=REPORTPORTAL_URL, max_connections=RP_MAX_CONNECTIONS,
+                 max_connections_per_host=RP_MAX_CONNECTIONS_PER_HOST,
+                 timeout=RP_TIMEOUT, connect_timeout=RP_CONNECT_TIMEOUT,
+                 keepalive_expiry=RP_KEEPALIVE_EXPIRY, defect_concurrency=DEFECT_FETCH_CONCURRENCY,
+                 launch_store_path=LAUNCH_STORE_PATH, trend_store_path=TREND_STORE_PATH, transport=None,
+                 issue_tracker_url=ISSUE_TRACKER_URL, issue_tracker_transport=None, http_cache_dir=HTTP_CACHE_DIR,
+                 defect_cache_file=DEFECT_CACHE_FILE, failed_items_cache_file=FAILED_ITEMS_CACHE_FILE,
+                 issue_cache_file=ISSUE_CACHE_FILE, journal=None):
+        self.base_url = base_url
+        self.launch_store = LaunchStore(launch_store_path)
+        self.trend_store = TrendStore(trend_store_path)
+        self.defect_cache = DefectCache(cache_file=defect_cache_file)
+        self.failed_items_cache = DefectCache(FAILED_ITEMS_CACHE_SIZE, failed_items_cache_file, "кэш упавших тестов")
+        self._max_connections_per_host = max_connections_per_host
+        self._timeout = timeout
+        self._connect_timeout = connect_timeout
+        self._host_semaphores = {}
+        # Общий лимит на страницы дефектов: ограничивает нагрузку, даже когда
+        # дефекты запрашиваются одновременно для всех прогонов отчета
+        self._defect_semaphore = asyncio.Semaphore(defect_concurrency)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        if journal is not None:
+            # Журнал пишет (или отдает) обмен с сервером, поэтому он ниже HTTP-кэша
+            transport = journal.wrap(transport or httpx.AsyncHTTPTransport(verify=False, limits=limits),
+                                     "reportportal", base_url)
+            issue_tracker_transport = journal.wrap(issue_tracker_transport or httpx.AsyncHTTPTransport(),
+                                                   "issue_tracker", issue_tracker_url)
+        if http_cache_dir:
+            # С собственным транспортом настройки пула задаются ему, а не клиенту
+            transport = CachingTransport(
+                transport or httpx.AsyncHTTPTransport(verify=False, limits=limits),
+                HttpCache(http_cache_dir, HTTP_CACHE_MAX_BYTES, utc_timestamp),
+                parse_freshness(HTTP_CACHE_FRESHNESS)
+            )
+        self._client = httpx.AsyncClient(
+            verify=False,
+            limits=limits,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            transport=transport
+        )
+        self.retry_policy = RetryPolicy(
+            max_attempts=RP_RETRY_ATTEMPTS,
+            base_delay=RP_RETRY_BASE_DELAY,
+            max_delay=RP_RETRY_MAX_DELAY,
+            retry_exceptions=RP_RETRY_EXCEPTIONS,
+            failure_threshold=RP_BREAKER_THRESHOLD,
+            reset_timeout=RP_BREAKER_RESET
+        )
+        self.tokens = TokenManager(self._send)
+        self.issue_tracker = None
+        if issue_tracker_url:
+            self.issue_tracker = IssueTracker(
+                issue_tracker_url,
+                IssueCache(ISSUE_CACHE_TTL, ISSUE_NEGATIVE_CACHE_TTL, ISSUE_CACHE_SIZE,
+                           issue_cache_file, utc_timestamp),
+                token=ISSUE_TRACKER_TOKEN,
+                batch_size=ISSUE_BATCH_SIZE,
+                concurrency=ISSUE_FETCH_CONCURRENCY,
+                timeout=timeout,
+                retry_policy=self.retry_policy,
+                transport=issue_tracker_transport
+            )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Закрываем пулы соединений и хранилища, сохраняем кэши"""
+        await self._client.aclose()
+        if self.issue_tracker is not None:
+            await self.issue_tracker.aclose()
+        self.launch_store.close()
+        self.trend_store.close()
+        self.defect_cache.save()
+        self.failed_items_cache.save()
+
+    def _host_semaphore(self, url):
+        """Семафор, ограничивающий число параллельных запросов к хосту"""
+        host = httpx.URL(url).host
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_connections_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _send(self, method, url, parser=None, **kwargs):
+        """Запрос через общий пул с повторами по retry_policy
+
+        Если передан parser, тело ответа не загружается целиком: корутина
+        parser получает поток байтов и ее результат возвращается вместо ответа.
+        Повторяются сетевые ошибки и ответы 429/5xx; таймаут запроса не выходит
+        за дедлайн текущего отчета.
+        """
+        endpoint = endpoint_label(url)
+
+        async def attempt():
+            timeout = request_timeout(self._timeout)
+            request_kwargs = {**kwargs, "timeout": httpx.Timeout(timeout, connect=min(self._connect_timeout, timeout))}
+            async with self._host_semaphore(url):
+                with METRICS.span("rp_request", endpoint=endpoint):
+                    if parser is None:
+                        response = await self._client.request(method, url, **request_kwargs)
+                    else:
+                        async with self._client.stream(method, url, **request_kwargs) as response:
+                            response.raise_for_status()
+                            return await parser(response.aiter_bytes())
+            response.raise_for_status()
+            return response
+
+        return await self.retry_policy.run(endpoint, attempt)
+
+    async def _request(self, method, url, headers=None, **kwargs):
+        """Авторизованный запрос: при 401 токен обновляется и запрос повторяется один раз"""
+        token = await self.tokens.get_token()
+        try:
+            return await self._send(method, url, headers={**(headers or {}), "Authorization": f"Bearer {token}"},
+                                    **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+            logger.warning(f"Токен отклонен сервером (401), обновляем и повторяем запрос {url}")
+            self.tokens.invalidate(token)
+            token = await self.tokens.get_token()
+            return await self._send(method, url, headers={**(headers or {}), "Authorization": f"Bearer {token}"},
+                                    **kwargs)
+
+    async def get_access_token(self):
+        """Получаем access_token от ReportPortal (из кэша, если он еще действителен)"""
+        return await self.tokens.get_token()
+
+    async def get_filtered_launches(self, section):
+        """Синхронизируем запуски проекта раздела и отбираем их по данным локального хранилища"""
+        project = section.project
+        window_start = utc_now() - timedelta(hours=section.window_hours)
+
+        try:
+            with METRICS.span("launches", project=project):
+                await self.sync_launches(project, window_start, section.filter)
+                launches = await asyncio.to_thread(self.launch_store.launches_since, project, window_start)
+                selected = section.select([Launch.from_api(launch, project) for launch in launches])
+                return await self.refresh_triage(project, selected)
+        except Exception as e:
+            logger.error(f"Ошибка при получении запусков: {e}")
+            raise
+
+    async def sync_launches(self, project, window_start, spec):
+        """Догружаем в хранилище новые запуски и обновляем незавершенные
+
+        Запрашиваются только запуски не старше самого свежего сохраненного
+        (high-water mark), а также ранее сохраненные запуски в статусе
+        IN_PROGRESS. Завершенные запуски повторно не загружаются.
+
+        Условия на атрибуты из spec выполняются на сервере. Фильтр по статусу
+        сюда не передается: хранилище должно видеть незавершенные запуски,
+        иначе запуск, завершившийся после high-water mark, будет потерян.
+        """
+        store = self.launch_store
+        high_water_mark = await asyncio.to_thread(store.high_water_mark, project, spec.sync_key)
+        since = max(high_water_mark, window_start) if high_water_mark else window_start
+        mutable_ids = await asyncio.to_thread(store.mutable_ids, project, window_start)
+
+        url = f"{self.base_url}/api/v1/{project}/launch"
+        launches = await self._fetch_all_launches(url, {
+            **spec.query_params(include_status=False),
+            "filter.gte.startTime": format_rp_time(since)
+        })
+        saved = await asyncio.to_thread(store.upsert, project, launches, spec.sync_key)
+        if mutable_ids:
+            refreshed = await self._fetch_launches_by_id(url, mutable_ids)
+            saved += await asyncio.to_thread(store.upsert, project, refreshed)
+
+        await asyncio.to_thread(store.prune, utc_now() - timedelta(days=LAUNCH_STORE_RETENTION_DAYS))
+        logger.info(f"Синхронизация запусков {project}: получено {saved}, "
+                    f"незавершенных на обновлении {len(mutable_ids)}")
+
+    async def refresh_triage(self, project, launches):
+        """Перечитываем разбор дефектов завершенных запусков, попавших в отчет
+
+        Кэш дефектов проверяется по lastModified и статистике запуска, а они
+        меняются и после его завершения: ссылки на задачи обычно добавляют
+        позже. Поэтому у выбранных разделом запусков эти поля запрашиваются
+        при каждой сборке отчета; один и тот же набор ID перепроверяется
+        HTTP-кэшем по ETag. Возвращает запуски с обновленными полями.
+        """
+        finished = sorted(launch.id for launch in launches if launch.fingerprint is not None)
+        if not finished:
+            return launches
+        fresh = await self._fetch_launches_by_id(f"{self.base_url}/api/v1/{project}/launch", finished)
+        stored = await asyncio.to_thread(self.launch_store.refresh_triage, project, fresh)
+        refreshed = {data["id"]: Launch.from_api(data, project) for data in stored}
+        return [refreshed.get(launch.id, launch) for launch in launches]
+
+    async def _fetch_launches_by_id(self, url, ids):
+        """Загружаем запуски по списку ID порциями по LAUNCH_ID_CHUNK_SIZE"""
+        chunks = [ids[start:start + LAUNCH_ID_CHUNK_SIZE] for start in range(0, len(ids), LAUNCH_ID_CHUNK_SIZE)]
+        results = await asyncio.gather(*(
+            self._fetch_all_launches(url, {"filter.in.id": ",".join(map(str, chunk))}) for chunk in chunks
+        ))
+        return [launch for chunk in results for launch in chunk]
+
+    async def _fetch_all_launches(self, url, filters):
+        """Загружаем все страницы запусков по фильтру"""
+        headers = {"Accept": "application/json, text/plain, */*"}
+        # Сортировка по возрастанию: новые запуски, появившиеся во время
+        # постраничной загрузки, не сдвигают уже прочитанные страницы
+        params = {
+            "page.page": 1,
+            "page.size": LAUNCH_PAGE_SIZE,
+            "page.sort": "startTime,number,ASC",
+            **filters
+        }
+        response = await self._request("GET", url, headers=headers, params=params)
+        data = response.json()
+        launches = data.get("content", [])
+
+        total_pages = data.get("page", {}).get("totalPages", 1)
+        if total_pages > 1:
+            responses = await asyncio.gather(*(
+                self._request("GET", url, headers=headers, params={**params, "page.page": page})
+                for page in range(2, total_pages + 1)
+            ))
+            for response in responses:
+                launches.extend(response.json().get("content", []))
+        return launches
+
+    @timed("defects")
+    async def get_defect_links(self, launch_id, project, fingerprint=None):
+        """Получаем список уникальных ссылок на дефекты для указанного launch_id
+
+        Если передан отпечаток запуска (launch_fingerprint) и он не изменился,
+        ссылки берутся из кэша без запросов к /item/v2.
+        """
+        cached = self.defect_cache.get(project, launch_id, fingerprint)
+        METRICS.inc("defect_cache", result="miss" if cached is None else "hit")
+        if cached is not None:
+            logger.info(f"Дефекты для launch_id {launch_id} взяты из кэша ({len(cached)})")
+            return cached
+
+        params = {
+            "filter.eq.hasStats": "true",
+            "filter.eq.hasChildren": "false",
+            "filter.in.issueType": "pb001",
+            "providerType": "launch",
+            "launchId": launch_id
+        }
+
+        try:
+            links = set()
+            async for issues in self._iter_item_pages(project, params, parse_issue_page):
+                for issue_type, comment in issues:
+                    if issue_type == "pb001" and get_report_config().is_defect_link(comment):
+                        links.add(comment)
+
+            logger.info(f"Найдено {len(links)} дефектов для launch_id {launch_id}")
+            links = sorted(links)
+            self.defect_cache.put(project, launch_id, fingerprint, links)
+            return links
+
+        except httpx.TimeoutException:
+            logger.error(f"Таймаут при получении дефектов для launch_id {launch_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при получении дефектов: {e}", exc_info=True)
+            raise
+
+    @timed("failed_items")
+    async def get_failed_items(self, launch_id, project, fingerprint=None):
+        """Упавшие тесты запуска в виде словаря {uniqueId: name}
+
+        Для неизменившегося запуска (по отпечатку) список берется из кэша.
+        """
+        cached = self.failed_items_cache.get(project, launch_id, fingerprint)
+        METRICS.inc("failed_items_cache", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return dict(cached)
+
+        params = {
+            "filter.eq.hasStats": "true",
+            "filter.eq.hasChildren": "false",
+            "filter.in.status": "FAILED",
+            "providerType": "launch",
+            "launchId": launch_id
+        }
+        failed = {}
+        async for items in self._iter_item_pages(project, params, parse_failed_items_page):
+            failed.update(items)
+        logger.info(f"Найдено {len(failed)} упавших тестов для launch_id {launch_id}")
+        self.failed_items_cache.put(project, launch_id, fingerprint, sorted(failed.items()))
+        return failed
+
+    async def load_launch_history(self, section):
+        """Сохраненные запуски раздела за срок хранения, от новых к старым
+
+        Загружается и разбирается один раз на отчет (в пуле потоков, не в
+        цикле событий), предыдущие запуски всех прогонов ищутся в этом списке.
+        """
+        since = utc_now() - timedelta(days=LAUNCH_STORE_RETENTION_DAYS)
+
+        def load():
+            stored = self.launch_store.launches_since(section.project, since)
+            launches = (Launch.from_api(data, section.project) for data in stored)
+            return [launch for launch in launches if section.filter.matches(launch)]
+
+        return await asyncio.to_thread(load)
+
+    async def get_failed_diff(self, section, launch, history):
+        """Сравниваем упавшие тесты запуска с предыдущим запуском той же ветки
+
+        history - запуски раздела из load_launch_history.
+        """
+        previous = find_previous_launch(section, launch, history)
+        if previous is None:
+            current = await self.get_failed_items(launch.id, section.project, launch.fingerprint)
+            return FailedDiff(previous=None, new=sorted(current.values()), fixed=[], persistent=[])
+
+        current, before = await asyncio.gather(
+            self.get_failed_items(launch.id, section.project, launch.fingerprint),
+            self.get_failed_items(previous.id, section.project, previous.fingerprint)
+        )
+        new, fixed, persistent = diff_failed_items(current, before)
+        return FailedDiff(previous=previous, new=new, fixed=fixed, persistent=persistent)
+
+    async def _iter_item_pages(self, project, params, parser):
+        """Разобранные parser страницы /item/v2 по мере загрузки
+
+        После первой страницы известно их общее число, поэтому остальные
+        загружаются параллельно (с общим лимитом) и отдаются по мере готовности:
+        вызывающий код сразу сворачивает их, не накапливая все страницы.
+        """
+        url = f"{self.base_url}/api/v1/{project}/item/v2"
+        params = {"page.size": ITEM_PAGE_SIZE, "page.sort": "startTime,ASC", **params}
+        result, page_info = await self._fetch_item_page(url, params, 1, parser)
+        yield result
+
+        total_pages = page_info.get("totalPages", 1)
+        if total_pages > 1:
+            for future in asyncio.as_completed(
+                [self._fetch_item_page(url, params, page, parser) for page in range(2, total_pages + 1)]
+            ):
+                result, _ = await future
+                yield result
+
+    async def _fetch_item_page(self, url, params, page, parser):
+        """Загружаем одну страницу /item/v2 с учетом общего лимита параллельности"""
+        async with self._defect_semaphore:
+            return await self._request("GET", url, headers={"Accept": "application/json"},
+                                       params={**params, "page.page": page}, parser=parser)
+
+
+def find_previous_launch(section, launch, history):
+    """Предыдущий запуск на той же ветке и версии из истории раздела (от новых к старым)"""
+    version = section.version_of(launch)
+    for candidate in history:
+        if (candidate.start_time < launch.start_time and candidate.branch == launch.branch
+                and section.version_of(candidate) == version):
+            return candidate
+    return None
+
+
+def endpoint_label(url):
+    """Метка endpoint для метрик: путь без /api/v1 и параметров"""
+    path = httpx.URL(url).path.strip("/")
+    if path.startswith("api/v1/"):
+        path = path[len("api/v1/"):]
+    return path
+
+
+def format_rp_time(moment):
+    """Форматируем время для фильтров ReportPortal"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + 'Z'
+
+
+def journal_state_paths():
+    """Хранилища и кэши, снимок которых сохраняется в журнал: {имя: путь}"""
+    return dict(zip(JOURNAL_STATE_NAMES, (LAUNCH_STORE_PATH, TREND_STORE_PATH, HTTP_CACHE_DIR, DEFECT_CACHE_FILE,
+                                          FAILED_ITEMS_CACHE_FILE, ISSUE_CACHE_FILE)))
+
+
+def get_rp_client(context):
+    """Возвращаем общий клиент ReportPortal, создавая его при первом обращении"""
+    client = context.bot_data.get("rp_client")
+    if client is None:
+        journal = context.bot_data.get("journal")
+        if not isinstance(journal, JournalReplay):
+            client = ReportPortalClient(journal=journal)
+        else:
+            # Воспроизведение идет тем же путем, что и запись, с хранилищами и
+            # кэшами из снимка в журнале; трекер опрашивается, если он был
+            # включен при записи
+            if journal.state is None:
+                logger.warning(f"В журнале {journal.path} нет снимка хранилищ и кэшей: воспроизведение "
+                               f"начинается с пустых, запросы могут не совпасть с записанными")
+            paths = journal.restore_state(JOURNAL_STATE_NAMES)
+            # Адрес ReportPortal - записанный: по нему ищутся ответы в HTTP-кэше
+            client = ReportPortalClient(base_url=journal.base_url("reportportal") or REPORTPORTAL_URL,
+                                        launch_store_path=paths["launch_store"],
+                                        trend_store_path=paths["trend_store"],
+                                        http_cache_dir=paths["http_cache"] if HTTP_CACHE_DIR else None,
+                                        defect_cache_file=paths["defect_cache"],
+                                        failed_items_cache_file=paths["failed_items_cache"],
+                                        issue_cache_file=paths["issue_cache"], journal=journal,
+                                        issue_tracker_url=ISSUE_TRACKER_URL or journal.base_url("issue_tracker"))
+        context.bot_data["rp_client"] = client
+    return client
+
+
+def format_statistics(launch, section):
+    """Форматируем статистику для вывода"""
+    launch_type = f"{section.name} прогон"
+    if not launch:
+        return f"{launch_type}: нет данных о запуске"
+
+    stats = launch.statistics
+    version = launch.attributes.get(section.version_attribute) if section.version_attribute else None
+
+    return (
+        f"{launch_type}\n"
+        f"ID запуска: {launch.id}\n"
+        f"Версия: {version or 'Не указана'}\n"
+        f"Ветка: {launch.branch or 'Не указана'}\n"
+        f"Коммит: {launch.commit_hash or 'Не указан'}\n"
+        f"Название: {launch.name}\n"
+        f"Всего тестов: {stats.total}\n"
+        f"Пройдено: {stats.passed}\n"
+        f"Провалено: {stats.failed}\n"
+        f"Пропущено: {stats.skipped}\n"
+        f"Статус: {launch.status}\n"
+        f"Время начала: {launch.start_time_raw}\n"
+        f"Ссылка: {REPORTPORTAL_URL}/ui/#{launch.project}/launches/all/{launch.id}\n"
+    )
+
+
+def format_test_names(names, limit=FAILED_DIFF_LIST_LIMIT):
+    """Список тестов для отчета, не длиннее limit строк"""
+    lines = [f"  • {html.escape(name or '')}" for name in names[:limit]]
+    if len(names) > limit:
+        lines.append(f"  … и еще {len(names) - limit}")
+    return lines
+
+
+def format_issue(link, issue):
+    """Ссылка на дефект с заголовком и исполнителем задачи"""
+    line = f"  {link} — {html.escape(issue.summary)}"
+    if issue.assignee:
+        line += f" ({html.escape(issue.assignee)})"
+    return line
+
+
+def format_defects(label, defects, issues=None):
+    """Форматируем список дефектов прогона (или ошибку его получения)
+
+    Если из трекера получена хотя бы одна задача (issues - {ссылка: Issue}),
+    дефекты группируются по статусу задачи: сначала открытые, затем в работе
+    и закрытые; ссылки без данных из трекера выводятся последними. Иначе
+    ссылки выводятся простым списком.
+    """
+    if isinstance(defects, BaseException):
+        return f"⚠️ Не удалось получить дефекты для {label}: {str(defects)}"
+    if not defects:
+        return f"🟢 Для {label} дефектов не найдено"
+    if not issues:
+        return "\n".join([f"🔴 <b>Список дефектов {label}:</b>", *defects])
+
+    groups = {}
+    unknown = []
+    for link in defects:
+        issue = issues.get(link)
+        if issue is None:
+            unknown.append(link)
+        else:
+            groups.setdefault(issue.status, []).append((link, issue))
+
+    def group_order(status):
+        category = groups[status][0][1].category
+        rank = STATUS_CATEGORY_ORDER.index(category) if category in STATUS_CATEGORY_ORDER else len(STATUS_CATEGORY_ORDER)
+        return rank, status
+
+    lines = [f"🔴 <b>Список дефектов {label}:</b>"]
+    for status in sorted(groups, key=group_order):
+        lines.append(f"<b>{html.escape(status)}</b> ({len(groups[status])}):")
+        lines.extend(format_issue(link, issue) for link, issue in groups[status])
+    if unknown:
+        lines.append(f"<b>Статус неизвестен</b> ({len(unknown)}):")
+        lines.extend(f"  {link}" for link in unknown)
+    return "\n".join(lines)
+
+
+def format_failed_diff(diff, label):
+    """Форматируем сравнение упавших тестов с предыдущим запуском (или ошибку сравнения)"""
+    if isinstance(diff, BaseException):
+        return f"⚠️ Не удалось сравнить упавшие тесты для {label}: {str(diff)}"
+
+    if diff.previous is None:
+        return "\n".join([
+            f"🧪 <b>Упавшие тесты {label}</b>: {len(diff.new)}, предыдущий запуск для сравнения не найден",
+            *format_test_names(diff.new)
+        ])
+
+    lines = [f"🧪 <b>Упавшие тесты {label}</b> в сравнении с запуском {diff.previous.id}:"]
+    lines.append(f"🆕 Новые падения: {len(diff.new)}")
+    lines.extend(format_test_names(diff.new))
+    lines.append(f"✅ Исправлены: {len(diff.fixed)}")
+    lines.extend(format_test_names(diff.fixed))
+    lines.append(f"♻️ Падают повторно: {len(diff.persistent)}")
+    return "\n".join(lines)
+
+
+def format_pass_rate(rate):
+    return "нет данных" if rate is None else f"{rate * 100:.1f}%"
+
+
+def format_trend(rows, period_days, detailed=False):
+    """Форматируем динамику по истории запусков
+
+    Для каждой версии (ветки Linux) - доля пройденных тестов и изменение к
+    запуску period_days дней назад, новые и исправленные дефекты и число
+    нестабильных дефектов. С detailed выводятся и сами ссылки на дефекты.
+    """
+    lines = [f"📈 <b>Динамика за {period_days} дн.</b>"]
+    for row in rows:
+        title = row["launch_key"]
+        pass_rate = row["pass_rate"]
+        if row["baseline_id"] is None:
+            lines.append(f"{title}: прохождение {format_pass_rate(pass_rate)}, "
+                         f"нет запусков для сравнения, нестабильных дефектов {row['flaky']}")
+            continue
+
+        baseline_rate = row["baseline_pass_rate"]
+        if pass_rate is not None and baseline_rate is not None:
+            delta = (pass_rate - baseline_rate) * 100
+            trend = "🔻" if delta < 0 else "🔺" if delta > 0 else "➖"
+            change = f"{trend} {delta:+.1f} п.п."
+        else:
+            change = "изменение неизвестно"
+        lines.append(
+            f"{title}: прохождение {format_pass_rate(pass_rate)} ({change} к запуску {row['baseline_id']}), "
+            f"новых дефектов {len(row['new_defects'])}, исправлено {len(row['resolved_defects'])}, "
+            f"нестабильных {row['flaky']}"
+        )
+        if detailed:
+            lines.extend(f"  🆕 {link}" for link in row["new_defects"])
+            lines.extend(f"  ✅ {link}" for link in row["resolved_defects"])
+
+    if len(lines) == 1:
+        lines.append("Нет сохраненных запусков")
+    return "\n".join(lines)
+
+
+async def load_trend(client, active_since):
+    """Сводка по истории запусков (без запросов к ReportPortal)"""
+    return await asyncio.to_thread(client.trend_store.summary, TREND_PERIOD_DAYS, active_since)
+
+
+async def record_trend(client, results):
+    """Сохраняем запуски отчета и их дефекты в историю
+
+    results - тройки (раздел, запуск, дефекты или исключение).
+    """
+    entries = [
+        (section.render(section.trend_key, launch), launch, None if isinstance(defects, BaseException) else defects)
+        for section, launch, defects in results
+    ]
+    store = client.trend_store
+    await asyncio.to_thread(store.record, entries)
+    await asyncio.to_thread(store.prune, utc_now() - timedelta(days=TREND_RETENTION_DAYS))
+
+
+def report_message(text):
+    """Часть отчета в виде параметров для send_message
+
+    Параметры у всех частей одинаковые, поэтому при отправке соседние части
+    упаковываются в общие сообщения.
+    """
+    return {"text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
+
+
+@dataclass(slots=True)
+class LaunchEntry:
+    """Прогон в отчете: запуск раздела, его дефекты и изменения в падениях
+
+    defects и failed_diff содержат исключение, если данные получить не удалось;
+    failed_diff равен None, если сравнение для раздела не включено. issues -
+    задачи трекера по ссылкам на дефекты или None, если трекер не опрашивался.
+    """
+    section: object
+    launch: Launch
+    defects: object
+    failed_diff: object = None
+    issues: dict = None
+
+    @property
+    def label(self):
+        return self.section.render(self.section.label, self.launch)
+
+    def to_dict(self):
+        launch = self.launch
+        stats = launch.statistics
+        data = {
+            "section": self.section.name,
+            "project": launch.project,
+            "id": launch.id,
+            "name": launch.name,
+            "status": launch.status,
+            "start_time": launch.start_time_raw,
+            "version": launch.attributes.get(self.section.version_attribute) if self.section.version_attribute else None,
+            "branch": launch.branch,
+            "commit": launch.commit_hash,
+            "url": f"{REPORTPORTAL_URL}/ui/#{launch.project}/launches/all/{launch.id}",
+            "statistics": {"total": stats.total, "passed": stats.passed, "failed": stats.failed, "skipped": stats.skipped},
+            "defects": None if isinstance(self.defects, BaseException) else self.defects,
+            "defects_error": str(self.defects) if isinstance(self.defects, BaseException) else None,
+        }
+        if self.issues is not None:
+            data["issues"] = {link: asdict(issue) for link, issue in self.issues.items()}
+        if self.section.failed_diff:
+            diff = self.failed_diff
+            if isinstance(diff, BaseException):
+                data["failed_diff"] = {"error": str(diff)}
+            else:
+                data["failed_diff"] = {
+                    "previous_id": diff.previous.id if diff.previous else None,
+                    "new": diff.new,
+                    "fixed": diff.fixed,
+                    "persistent": diff.persistent
+                }
+        return data
+
+
+@dataclass(slots=True)
+class Report:
+    """Собранный отчет, не зависящий от способа доставки
+
+    sections - разделы в порядке описания (в том числе без запусков), entries -
+    прогоны всех разделов по порядку. Приемники (sinks) получают из отчета
+    сообщения Telegram (messages) или структуру для JSON (to_dict).
+    """
+    title: str
+    sections: tuple = ()
+    entries: list = field(default_factory=list)
+    trend: list = None
+    built_at: datetime = field(default_factory=utc_now)
+
+    def messages(self):
+        """Части отчета в виде параметров send_message"""
+        # На сообщения Telegram части отчета делит TelegramSender
+        messages = [report_message(self.title)]
+
+        for section in self.sections:
+            entries = [entry for entry in self.entries if entry.section is section]
+            if not entries:
+                messages.append(report_message(f"⚠️ {section.name} прогоны не найдены"))
+            for entry in entries:
+                messages.append(report_message(format_statistics(entry.launch, section)))
+
+        # Дефекты в порядке разделов и прогонов
+        for entry in self.entries:
+            messages.append(report_message(format_defects(entry.label, entry.defects, entry.issues)))
+
+        # Изменения в упавших тестах по сравнению с предыдущими запусками
+        for entry in self.entries:
+            if entry.section.failed_diff:
+                messages.append(report_message(format_failed_diff(entry.failed_diff, entry.label)))
+
+        if self.trend:
+            messages.append(report_message(format_trend(self.trend, TREND_PERIOD_DAYS)))
+        return messages
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "built_at": self.built_at.isoformat(),
+            "sections": [
+                {
+                    "name": section.name,
+                    "project": section.project,
+                    "launches": [entry.to_dict() for entry in self.entries if entry.section is section]
+                }
+                for section in self.sections
+            ],
+            "trend": self.trend
+        }
+
+
+async def collect_entries(client, jobs):
+    """Прогоны отчета (LaunchEntry) для пар (section, launch) в том же порядке
+
+    С REPORT_SHARD_WORKERS прогоны обрабатываются по шардам, иначе все сразу.
+    История запусков для сравнения упавших тестов загружается один раз на
+    раздел, задачи трекера запрашиваются один раз для всех прогонов.
+    """
+    diff_sections = list(dict.fromkeys(section for section, _ in jobs if section.failed_diff))
+    histories = dict(zip(diff_sections, await asyncio.gather(
+        *(client.load_launch_history(section) for section in diff_sections)
+    )))
+    if REPORT_SHARD_WORKERS > 0 and len(jobs) > 1:
+        entries = await collect_entries_sharded(client, jobs, histories, REPORT_SHARD_WORKERS,
+                                                REPORT_SHARD_QUEUE_SIZE)
+    else:
+        entries = await fetch_entries(client, jobs, histories)
+
+    await enrich_defects(client, entries)
+    return entries
+
+
+async def collect_entries_sharded(client, jobs, histories, workers, queue_size):
+    """Прогоны отчета по шардам (проект, ветка) в пуле обработчиков
+
+    Прогоны одной ветки обрабатываются вместе одним обработчиком, а число
+    одновременно обрабатываемых шардов ограничено размером пула, поэтому
+    большие отчеты не создают запросы для всех прогонов сразу. Порядок
+    результата совпадает с порядком jobs.
+    """
+    shards = shard_by(jobs, lambda job: (job[0].project, job[1].branch))
+
+    async def process(key, items):
+        return await fetch_entries(client, [job for _, job in items], histories)
+
+    entries = [None] * len(jobs)
+    results = await run_sharded(shards, process, workers, queue_size, name="report_shard")
+    for (_, items), shard_entries in zip(shards, results):
+        for (index, _), entry in zip(items, shard_entries):
+            entries[index] = entry
+    return entries
+
+
+async def fetch_entries(client, jobs, histories):
+    """Дефекты и сравнения упавших тестов для прогонов (section, launch)
+
+    histories - история запусков разделов с failed_diff. Все запросы
+    выполняются параллельно: время определяется самым медленным прогоном,
+    а не суммой.
+    """
+    diff_jobs = [(section, launch) for section, launch in jobs if section.failed_diff]
+    defect_results, diff_results = await asyncio.gather(
+        asyncio.gather(
+            *(client.get_defect_links(launch.id, section.project, fingerprint=launch.fingerprint)
+              for section, launch in jobs),
+            return_exceptions=True
+        ),
+        asyncio.gather(
+            *(client.get_failed_diff(section, launch, histories[section]) for section, launch in diff_jobs),
+            return_exceptions=True
+        )
+    )
+    diffs = dict(zip((launch.id for _, launch in diff_jobs), diff_results))
+
+    entries = []
+    for (section, launch), defects in zip(jobs, defect_results):
+        entry = LaunchEntry(section, launch, defects, diffs.get(launch.id))
+        if isinstance(defects, BaseException):
+            logger.error(f"Ошибка при получении дефектов для {entry.label}: {defects}")
+        else:
+            logger.info(f"Дефекты для {entry.label} (ID: {launch.id}): найдено {len(defects)}")
+        if isinstance(entry.failed_diff, BaseException):
+            logger.error(f"Ошибка при сравнении упавших тестов для {entry.label}: {entry.failed_diff}")
+        entries.append(entry)
+    return entries
+
+
+async def enrich_defects(client, entries):
+    """Задачи трекера для дефектов всех прогонов
+
+    Ссылки собираются со всех прогонов и запрашиваются один раз: задача,
+    встречающаяся в нескольких прогонах, ищется в трекере однократно. Ошибка
+    трекера не мешает отчету - дефекты выводятся простыми ссылками.
+    """
+    tracker = client.issue_tracker
+    if tracker is None:
+        return
+    # Порядок первого появления: пачки запросов к трекеру одинаковы от запуска к запуску
+    links = list(dict.fromkeys(
+        link for entry in entries if not isinstance(entry.defects, BaseException) for link in entry.defects
+    ))
+    if not links:
+        return
+
+    try:
+        with METRICS.span("issue_enrichment"):
+            issues = await tracker.lookup(links)
+    except Exception as e:
+        logger.error(f"Не удалось получить задачи трекера: {e}", exc_info=True)
+        return
+    for entry in entries:
+        if not isinstance(entry.defects, BaseException):
+            entry.issues = {link: issues[link] for link in entry.defects if link in issues}
+
+
+@timed("report_build")
+async def build_report(client, config=None):
+    """Собираем отчет (Report) без отправки"""
+    config = config or get_report_config()
+    access_token = await client.get_access_token()
+    logger.info(f"Токен получен успешно")
+
+    if not access_token:
+        return Report(title="❌ Не удалось получить access_token")
+
+    # Собираем запуски всех разделов параллельно с общим таймаутом
+    try:
+        section_launches = await asyncio.wait_for(
+            asyncio.gather(*(client.get_filtered_launches(section) for section in config.sections)),
+            timeout=60
+        )
+    except asyncio.TimeoutError as e:
+        logger.error(f"Таймаут при получении данных о запусках: {e}")
+        raise
+
+    jobs = []
+    for section, launches in zip(config.sections, section_launches):
+        logger.info(f"{section.name} прогоны: {[launch.id for launch in launches]}")
+        jobs.extend((section, launch) for launch in launches)
+
+    report = Report(title=config.title, sections=config.sections, entries=await collect_entries(client, jobs))
+
+    # История не должна мешать отчету: при ошибке раздел динамики пропускается
+    try:
+        await record_trend(client, [(entry.section, entry.launch, entry.defects) for entry in report.entries])
+        window_hours = max(section.window_hours for section in config.sections)
+        report.trend = await load_trend(client, utc_now() - timedelta(hours=window_hours))
+    except Exception as e:
+        logger.error(f"Не удалось обновить историю запусков: {e}", exc_info=True)
+
+    return report
+
+
+def format_age(seconds):
+    """Возраст снимка отчета для подписи"""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "меньше минуты"
+    if minutes < 60:
+        return f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60} мин"
+
+
+@dataclass(frozen=True, slots=True)
+class ReportSnapshot:
+    """Готовый к отправке отчет: сообщения отрисованы при сборке"""
+    report: Report
+    messages: tuple
+
+    @classmethod
+    def from_report(cls, report):
+        return cls(report, tuple(report.messages()))
+
+    def messages_with_age(self, now=None):
+        """Сообщения снимка; в заголовок добавляется время сборки"""
+        now = now or utc_now()
+        age = format_age((now - self.report.built_at).total_seconds())
+        title, *rest = self.messages
+        note = f"🕒 Снимок отчета собран {age} назад, /report fresh - собрать заново"
+        return [{**title, "text": f"{title['text']}\n{note}"}, *rest]
+
+
+class ReportBuilder:
+    """Сборка отчета с объединением одновременных запросов
+
+    Одновременные запросы /report присоединяются к уже идущей сборке, а
+    готовый результат раздается всем чатам в течение ttl секунд, поэтому N
+    одновременных команд стоят одной нагрузки на ReportPortal. Последний
+    успешно собранный отчет хранится как снимок (snapshot) с отрисованными
+    сообщениями независимо от ttl.
+    """
+
+    def __init__(self, client, ttl=REPORT_CACHE_TTL):
+        self._client = client
+        self._ttl = ttl
+        self._task = None
+        self._report = None
+        self._built_at = 0
+        self.snapshot = None
+
+    async def get_report(self, fresh=False):
+        """Отчет не старше ttl секунд; с fresh - собранный заново"""
+        if not fresh and self._report is not None and time_module.monotonic() - self._built_at < self._ttl:
+            logger.info("Отчет взят из кэша")
+            return self._report
+
+        if self._task is None:
+            # Задача наследует контекст, поэтому дедлайн и бюджет повторов
+            # действуют на все запросы этой сборки
+            with retry_scope(REPORT_DEADLINE, REPORT_RETRY_BUDGET):
+                self._task = asyncio.ensure_future(build_report(self._client))
+            self._task.add_done_callback(self._on_built)
+        else:
+            logger.info("Присоединяемся к уже идущей сборке отчета")
+        # shield: отмена одного из ожидающих не должна прерывать общую сборку
+        return await asyncio.shield(self._task)
+
+    def _on_built(self, task):
+        self._task = None
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self._report = task.result()
+            self._built_at = time_module.monotonic()
+            self.snapshot = ReportSnapshot.from_report(self._report)
+
+
+def get_report_builder(context):
+    """Возвращаем общий сборщик отчета, создавая его при первом обращении"""
+    builder = context.bot_data.get("report_builder")
+    if builder is None:
+        builder = ReportBuilder(get_rp_client(context))
+        context.bot_data["report_builder"] = builder
+    return builder
+
+
+async def build_launch_report(client, section, launch):
+    """Отчет об одном завершившемся запуске: статистика, дефекты и изменения в падениях"""
+    return Report(
+        title=f"🏁 <b>Завершен {section.name} прогон</b>",
+        sections=(section,),
+        entries=await collect_entries(client, [(section, launch)])
+    )
+
+
+class LaunchWatcher:
+    """Наблюдение за завершением запусков с отправкой отчета по каждому
+
+    Каждый опрос - это инкрементальная синхронизация хранилища запусков:
+    запрашиваются только новые запуски и те, что еще выполнялись. Запуски
+    разделов отчета в финальном статусе, о которых еще не сообщали, получают
+    отдельный отчет. Отметки об отправке хранятся в хранилище запусков, поэтому
+    об одном запуске не сообщается дважды и после перезапуска бота.
+
+    Интервал опроса адаптивный: пока есть выполняющиеся запуски или только что
+    были уведомления, он минимальный, иначе удваивается до max_interval.
+    """
+
+    def __init__(self, client, sender, chat_id=WATCH_CHAT_ID, config=None,
+                 min_interval=WATCH_MIN_INTERVAL, max_interval=WATCH_MAX_INTERVAL):
+        self._client = client
+        self._sender = sender
+        self._chat_id = chat_id
+        self._config = config or get_report_config()
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self.interval = min_interval
+        self.last_notified = 0
+
+    async def poll(self):
+        """Один опрос; возвращает интервал до следующего"""
+        with retry_scope(REPORT_DEADLINE, REPORT_RETRY_BUDGET), METRICS.span("watch_poll"):
+            results = await asyncio.gather(
+                *(self._poll_section(section) for section in self._config.sections),
+                return_exceptions=True
+            )
+
+            active = False
+            notified = 0
+            for section, result in zip(self._config.sections, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"Ошибка при опросе запусков {section.name}: {result}")
+                    continue
+                section_active, finished = result
+                active = active or section_active
+                for launch in finished:
+                    await self._notify(section, launch)
+                    notified += 1
+
+        self.last_notified = notified
+        if active or notified:
+            self.interval = self._min_interval
+        else:
+            self.interval = min(self._max_interval, self.interval * 2)
+        logger.info(f"Опрос запусков: отправлено отчетов {notified}, "
+                    f"{'есть' if active else 'нет'} выполняющихся, следующий опрос через {self.interval:.0f} с")
+        return self.interval
+
+    async def _poll_section(self, section):
+        """Синхронизируем запуски раздела и выбираем завершившиеся без уведомления
+
+        Возвращает (есть ли выполняющиеся запуски, новые завершенные запуски).
+        """
+        client = self._client
+        store = client.launch_store
+        project = section.project
+        window_start = utc_now() - timedelta(hours=section.window_hours)
+
+        await client.sync_launches(project, window_start, section.filter)
+        stored = await asyncio.to_thread(store.launches_since, project, window_start)
+        launches = [Launch.from_api(launch, project) for launch in stored]
+
+        # Выполняющиеся запуски проверяются без условия на статус
+        running_filter = replace(section.filter, statuses=(), excluded_statuses=())
+        active = any(launch.status == "IN_PROGRESS" and running_filter.matches(launch) for launch in launches)
+        finished = [launch for launch in launches if section.filter.matches(launch)]
+
+        # Состояние наблюдения - по разделу: разделы одного проекта (например,
+        # разных версий) опрашиваются независимо
+        first_poll = await asyncio.to_thread(store.start_watching, section.name)
+        claimed = set(await asyncio.to_thread(store.claim_notifications, section.name, project,
+                                              [launch.id for launch in finished]))
+        if first_poll:
+            # Уже завершенные к началу наблюдения запуски только отмечаются
+            logger.info(f"Начато наблюдение за разделом {section.name} ({project}): "
+                        f"{len(claimed)} завершенных запусков отмечены без отправки")
+            return active, []
+        # От старых к новым, чтобы уведомления шли в порядке завершения
+        return active, [launch for launch in reversed(finished) if launch.id in claimed]
+
+    async def _notify(self, section, launch):
+        logger.info(f"Запуск {launch.id} ({section.name}) завершен со статусом {launch.status}, отправляем отчет")
+        try:
+            report = await build_launch_report(self._client, section, launch)
+            await publish(report, [TelegramSink(self._sender, self._chat_id)])
+            METRICS.inc("watch_notifications", section=section.name)
+        except Exception as e:
+            # Запуск уже отмечен: повторная отправка могла бы продублировать отчет
+            logger.error(f"Не удалось отправить отчет о запуске {launch.id}: {e}", exc_info=True)
+
+
+def get_launch_watcher(context):
+    """Возвращаем наблюдателя за запусками, создавая его при первом обращении"""
+    watcher = context.bot_data.get("launch_watcher")
+    if watcher is None:
+        watcher = LaunchWatcher(get_rp_client(context), get_telegram_sender(context))
+        context.bot_data["launch_watcher"] = watcher
+    return watcher
+
+
+async def watch_launches(context: CallbackContext):
+    """Задача опроса запусков: после каждого опроса планирует следующий"""
+    watcher = get_launch_watcher(context)
+    try:
+        interval = await watcher.poll()
+    except Exception as e:
+        logger.error(f"Ошибка при опросе запусков: {e}", exc_info=True)
+        interval = watcher.interval
+    context.job_queue.run_once(watch_launches, interval, name="launch_watcher")
+    if watcher.last_notified and REPORT_SNAPSHOT_INTERVAL:
+        # Завершились запуски - снимок отчета устарел
+        context.job_queue.run_once(refresh_snapshot, 0, name="report_snapshot_refresh")
+
+
+async def refresh_snapshot(context: CallbackContext):
+    """Задача фонового обновления снимка отчета"""
+    try:
+        with METRICS.span("report_snapshot"):
+            await get_report_builder(context).get_report(fresh=True)
+        logger.info("Снимок отчета обновлен")
+    except Exception as e:
+        logger.error(f"Не удалось обновить снимок отчета: {e}", exc_info=True)
+
+
+def get_telegram_sender(context):
+    """Возвращаем общую очередь отправки в Telegram, создавая ее при первом обращении"""
+    sender = context.bot_data.get("telegram_sender")
+    if sender is None:
+        sender = TelegramSender(
+            context.bot,
+            group_rate_per_minute=TELEGRAM_GROUP_RATE_PER_MINUTE,
+            private_rate_per_minute=TELEGRAM_PRIVATE_RATE_PER_MINUTE,
+            burst=TELEGRAM_BURST
+        )
+        context.bot_data["telegram_sender"] = sender
+    return sender
+
+
+@timed("report")
+async def publish_report(context: CallbackContext, sinks, fresh=False):
+    """Собираем отчет (или берем недавно собранный) и публикуем во все приемники"""
+    report = await get_report_builder(context).get_report(fresh=fresh)
+    await publish(report, sinks)
+
+
+async def send_report_to_chat(context: CallbackContext, chat_id: int, extra_sinks=(), fresh=False):
+    """Функция для отправки отчета в указанный чат (и дополнительные приемники)"""
+    from telegram.error import BadRequest
+
+    try:
+        await publish_report(context, [TelegramSink(get_telegram_sender(context), chat_id), *extra_sinks],
+                             fresh=fresh)
+
+        logger.info("Отчет успешно отправлен в канал")
+    except BadRequest as e:
+        logger.error(f"Ошибка Telegram API: {e.message}")
+        if "Chat not found" in str(e):
+            logger.error("Проверьте правильность TELEGRAM_CHAT_ID")
+        raise
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}", exc_info=True)
+        raise
+
+
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /report
+
+    Если есть снимок отчета, ответ отправляется из него сразу, с указанием
+    возраста снимка. /report fresh (или отсутствие снимка) - сборка заново.
+    """
+    chat_id = update.effective_chat.id
+    fresh = bool(context.args) and context.args[0].lower() == "fresh"
+    try:
+        snapshot = get_report_builder(context).snapshot
+        if fresh or snapshot is None:
+            METRICS.inc("report_snapshot_requests", result="fresh" if fresh else "missing")
+            await send_report_to_chat(context, chat_id, fresh=fresh)
+        else:
+            METRICS.inc("report_snapshot_requests", result="hit")
+            await get_telegram_sender(context).send_many(chat_id, snapshot.messages_with_age())
+    except Exception as e:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"🚨 Не удалось отправить отчет: {str(e)}"
+        )
+
+
+async def trend_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /trend: динамика по сохраненной истории запусков"""
+    try:
+        trend = await load_trend(get_rp_client(context),
+                                 utc_now() - timedelta(days=TREND_PERIOD_DAYS))
+        await get_telegram_sender(context).send_many(
+            update.effective_chat.id, [report_message(format_trend(trend, TREND_PERIOD_DAYS, detailed=True))]
+        )
+    except Exception as e:
+        logger.error(f"Не удалось построить динамику: {e}", exc_info=True)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"🚨 Не удалось построить динамику: {str(e)}"
+        )
+
+
+async def daily_report(context: CallbackContext):
+    """Ежедневная отправка отчета"""
+    try:
+        await send_report_to_chat(context, TELEGRAM_CHAT_ID)
+    except Exception as e:
+        await context.bot.send_message(
+            chat_id=TELEGRAM_CHAT_ID,
+            text=f"🚨 Не удалось отправить отчет: {str(e)}"
+        )
+
+
+def file_sinks(json_path=None, html_path=None):
+    """Приемники отчета в файлы, если заданы пути"""
+    sinks = []
+    if json_path:
+        sinks.append(JsonFileSink(json_path))
+    if html_path:
+        sinks.append(HtmlFileSink(html_path))
+    return sinks
+
+
+async def dry_run_async(json_path=None, html_path=None, journal_path=None, journal=None, journal_state=False):
+    """Сборка отчета без Telegram: вывод в stdout и, если заданы, в файлы
+
+    С journal_path обмен с ReportPortal и трекером записывается в журнал
+    (с journal_state - и снимок хранилищ и кэшей на начало прогона),
+    journal - готовый журнал (JournalReplay при воспроизведении).
+    """
+    if journal_path:
+        journal = JournalWriter(journal_path, mode="dry-run", state=journal_state_paths() if journal_state else None)
+    # Вместо приложения Telegram - только хранилище общих объектов (bot_data)
+    context = SimpleNamespace(bot_data={"journal": journal} if journal else {})
+    try:
+        await publish_report(context, [StdoutSink(), *file_sinks(json_path, html_path)])
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении: {e}")
+        exit(1)
+    finally:
+        await close_rp_client(context)
+        METRICS.log_summary()
+        if METRICS_FILE:
+            METRICS.write_json(METRICS_FILE)
+        if journal is not None:
+            journal.close()
+
+
+async def main_async(json_path=None, html_path=None, journal_path=None, journal=None, chat_id=TELEGRAM_CHAT_ID,
+                     journal_state=False):
+    """Асинхронная основная функция: разовая отправка отчета в TELEGRAM_CHAT_ID
+
+    С journal_path все запросы к ReportPortal, трекеру и Telegram, ответы,
+    время и повторы записываются в журнал (см. replay_async), с journal_state -
+    и снимок хранилищ и кэшей на начало прогона.
+    """
+    from telegram.ext import ApplicationBuilder
+
+    if journal_path:
+        journal = JournalWriter(journal_path, mode="report", chat_id=chat_id,
+                                state=journal_state_paths() if journal_state else None)
+    application = None
+    try:
+        builder = ApplicationBuilder().token(TELEGRAM_TOKEN or "0:journal")
+        if journal is not None:
+            builder = builder.request(journal.telegram_request())
+        application = builder.build()
+        if journal is not None:
+            application.bot_data["journal"] = journal
+
+        # Отправляем отчет
+        await send_report_to_chat(application, chat_id, extra_sinks=file_sinks(json_path, html_path))
+
+        # Останавливаем приложение
+        if application.running:
+            await application.stop()
+            await application.shutdown()
+
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении: {e}")
+
+        # Пытаемся отправить сообщение об ошибке, если приложение создано
+        if application and hasattr(application, 'bot'):
+            try:
+                await application.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"🚨 Не удалось отправить отчет: {str(e)}"
+                )
+            except Exception as bot_error:
+                logger.error(f"Не удалось отправить сообщение об ошибке: {bot_error}")
+
+        # Завершаем приложение если оно создано
+        if application and application.running:
+            try:
+                await application.stop()
+                await application.shutdown()
+            except Exception:
+                pass
+
+        exit(1)
+    finally:
+        if application:
+            await close_rp_client(application)
+        METRICS.log_summary()
+        if METRICS_FILE:
+            METRICS.write_json(METRICS_FILE)
+        if journal is not None:
+            journal.close()
+
+
+async def replay_async(journal_path, speed=1.0, json_path=None, html_path=None):
+    """Воспроизводим записанный прогон без сети
+
+    Ответы ReportPortal, трекера и Telegram берутся из журнала (с задержками
+    записи, ускоренными в speed раз; 0 - без задержек), часы отчета
+    переводятся на момент записи. Прогон идет тем же путем, что и записанный:
+    отправка в Telegram или вывод в stdout.
+    """
+    journal = JournalReplay(journal_path, speed)
+    set_report_clock(journal.started_at)
+    logger.info(f"Воспроизведение {journal_path}: режим {journal.mode}, записан {journal.started_at}, "
+                f"скорость {speed or 'без задержек'}")
+    started = time_module.perf_counter()
+    if journal.mode == "report":
+        await main_async(json_path, html_path, journal=journal, chat_id=journal.chat_id)
+    else:
+        await dry_run_async(json_path, html_path, journal=journal)
+    logger.info(f"Воспроизведение заняло {time_module.perf_counter() - started:.2f} с")
+
+
+async def start_metrics(application):
+    """Запускаем endpoint /metrics, если задан METRICS_PORT"""
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = await start_metrics_server(METRICS, METRICS_PORT)
+
+
+async def close_rp_client(application):
+    """Закрываем пул соединений с ReportPortal и сохраняем кэши"""
+    client = application.bot_data.pop("rp_client", None)
+    if client is not None:
+        await client.aclose()
+    metrics_server = application.bot_data.pop("metrics_server", None)
+    if metrics_server is not None:
+        metrics_server.close()
+
+
+def daily_report_time():
+    """Время ежедневного отчета с учетом часового пояса"""
+    import pytz
+
+    hours, minutes = map(int, DAILY_REPORT_TIME.split(":"))
+    return time(hours, minutes, tzinfo=pytz.timezone(REPORT_TIMEZONE))
+
+
+def run_bot(watch=False):
+    """Постоянно работающий бот: команда /report и ежедневный отчет по расписанию
+
+    Клиент ReportPortal с пулом соединений, токен и кэши живут все время работы
+    бота, поэтому отчет по команде не платит за холодный старт. Снимок отчета
+    обновляется в фоне, и /report отвечает из него без сборки. С watch бот
+    также следит за запусками, присылает отчет о каждом завершившемся и
+    обновляет снимок.
+    """
+    from telegram.ext import ApplicationBuilder, CommandHandler
+
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(start_metrics)
+        .post_shutdown(close_rp_client)
+        .build()
+    )
+    application.add_handler(CommandHandler("report", report_command))
+    application.add_handler(CommandHandler("trend", trend_command))
+    application.job_queue.run_daily(daily_report, time=daily_report_time(), name="daily_report")
+    if REPORT_SNAPSHOT_INTERVAL:
+        application.job_queue.run_repeating(refresh_snapshot, REPORT_SNAPSHOT_INTERVAL, first=0,
+                                            name="report_snapshot")
+        logger.info(f"Снимок отчета обновляется каждые {REPORT_SNAPSHOT_INTERVAL} с")
+    if watch:
+        application.job_queue.run_once(watch_launches, 0, name="launch_watcher")
+        logger.info(f"Наблюдение за запусками включено, интервал опроса {WATCH_MIN_INTERVAL:.0f}-"
+                    f"{WATCH_MAX_INTERVAL:.0f} с")
+    logger.info(f"Бот запущен, ежедневный отчет в {DAILY_REPORT_TIME} ({REPORT_TIMEZONE})")
+    application.run_polling()
+
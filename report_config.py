@@ -0,0 +1,178 @@
+import tomllib
+from dataclasses import dataclass
+
+# Статусы незавершенных запусков ReportPortal: по умолчанию раздел берет
+# запуски в любом другом статусе, в том числе RESETED и будущих
+RUNNING_STATUSES = ("IN_PROGRESS",)
+
+
+@dataclass(frozen=True)
+class LaunchFilterSpec:
+    """Декларативный фильтр запусков проекта
+
+    attributes и statuses передаются в ReportPortal как filter.has.compositeAttribute
+    и filter.in.status. Условия, которые API выразить не может (префикс значения,
+    наличие атрибута с любым значением, исключенные статусы excluded_statuses),
+    проверяются в Python.
+    """
+    attributes: tuple = ()
+    statuses: tuple = ()
+    excluded_statuses: tuple = ()
+    attribute_prefixes: tuple = ()
+    required_keys: tuple = ()
+
+    def query_params(self, include_status=True):
+        """Параметры запроса ReportPortal для серверной части фильтра"""
+        params = {}
+        if self.attributes:
+            params["filter.has.compositeAttribute"] = ",".join(f"{key}:{value}" for key, value in self.attributes)
+        if include_status and self.statuses:
+            params["filter.in.status"] = ",".join(self.statuses)
+        return params
+
+    @property
+    def sync_key(self):
+        """Ключ синхронизации хранилища запусков для этого фильтра"""
+        return "&".join(f"{key}={value}" for key, value in self.query_params(include_status=False).items())
+
+    def matches(self, launch):
+        """Полная проверка запуска (Launch), включая условия, не выразимые в API"""
+        if self.statuses and launch.status not in self.statuses:
+            return False
+        if launch.status in self.excluded_statuses:
+            return False
+
+        attributes = launch.attributes
+        for key, value in self.attributes:
+            if attributes.get(key) != value:
+                return False
+        for key in self.required_keys:
+            if not attributes.get(key):
+                return False
+        for key, prefixes in self.attribute_prefixes:
+            value = attributes.get(key)
+            if not value or not value.startswith(prefixes):
+                return False
+        return True
+
+
+class _TemplateFields(dict):
+    """Поля шаблона подписи: вместо отсутствующего атрибута выводится Не указана"""
+
+    def __missing__(self, key):
+        return "Не указана"
+
+
+@dataclass(frozen=True)
+class ReportSection:
+    """Раздел отчета: проект, отбор запусков и правила группировки
+
+    Из запусков за последние window_hours часов, прошедших фильтр, берется
+    самый свежий для каждой группы. Группа - это версия (первый подходящий
+    префикс из versions) и значения атрибутов group_by. С failed_diff
+    упавшие тесты запуска сравниваются с предыдущим запуском той же ветки.
+    """
+    name: str
+    project: str
+    window_hours: int
+    filter: LaunchFilterSpec
+    version_attribute: str = None
+    versions: tuple = ()
+    group_by: tuple = ()
+    label: str = "{version}"
+    trend_key: str = "{version}"
+    failed_diff: bool = False
+
+    def version_of(self, launch):
+        """Версия запуска: префикс из versions или полное значение атрибута"""
+        value = launch.attributes.get(self.version_attribute) if self.version_attribute else None
+        if not self.versions or not value:
+            return value
+        for version in self.versions:
+            if value.startswith(version):
+                return version
+        return None
+
+    def select(self, launches):
+        """Отбираем самый свежий запуск каждой группы
+
+        Если заданы versions, запуски упорядочены по ним, иначе остается
+        порядок входного списка.
+        """
+        latest = {}
+        # Серверные условия повторно проверяются локально: хранилище запусков
+        # общее для всех фильтров проекта
+        for launch in launches:
+            if not self.filter.matches(launch):
+                continue
+            key = (self.version_of(launch), *(launch.attributes.get(attribute) for attribute in self.group_by))
+            existing_launch = latest.get(key)
+            if not existing_launch or launch.start_time > existing_launch.start_time:
+                latest[key] = launch
+
+        selected = list(latest.values())
+        if self.versions:
+            selected.sort(key=lambda launch: self.versions.index(self.version_of(launch)))
+        return selected
+
+    def render(self, template, launch):
+        """Подставляем в шаблон атрибуты запуска и {version}"""
+        fields = _TemplateFields(launch.attributes)
+        version = self.version_of(launch)
+        if version:
+            fields["version"] = version
+        return template.format_map(fields)
+
+
+@dataclass(frozen=True)
+class ReportConfig:
+    """Описание отчета: заголовок, разделы и признаки ссылок на дефекты"""
+    title: str
+    sections: tuple
+    defect_link_prefixes: tuple = ()
+
+    def is_defect_link(self, comment):
+        """Проверяем, что комментарий к дефекту является ссылкой на задачу"""
+        return bool(comment) and comment.startswith(self.defect_link_prefixes)
+
+
+def _section_from_dict(data):
+    try:
+        versions = tuple(data.get("versions", ()))
+        version_attribute = data.get("version_attribute")
+        if versions and not version_attribute:
+            raise ValueError("versions задан без version_attribute")
+        return ReportSection(
+            name=data["name"],
+            project=data["project"],
+            window_hours=int(data["window_hours"]),
+            filter=LaunchFilterSpec(
+                attributes=tuple((key, str(value)) for key, value in data.get("attributes", {}).items()),
+                statuses=tuple(data.get("statuses", ())),
+                excluded_statuses=() if "statuses" in data else RUNNING_STATUSES,
+                attribute_prefixes=((version_attribute, versions),) if versions else (),
+                required_keys=tuple(data.get("required_keys", ()))
+            ),
+            version_attribute=version_attribute,
+            versions=versions,
+            group_by=tuple(data.get("group_by", ())),
+            label=data.get("label", "{version}"),
+            trend_key=data.get("trend_key", "{version}"),
+            failed_diff=bool(data.get("failed_diff", False))
+        )
+    except KeyError as e:
+        raise ValueError(f"В разделе отчета {data.get('name', '?')} не задано поле {e}") from None
+
+
+def load_report_config(path):
+    """Читаем описание отчета из TOML-файла"""
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+    sections = tuple(_section_from_dict(section) for section in data.get("sections", ()))
+    if not sections:
+        raise ValueError(f"В {path} не описано ни одного раздела отчета")
+    return ReportConfig(
+        title=data.get("title", "📊 <b>Отчет о тестировании</b> 📊"),
+        sections=sections,
+        defect_link_prefixes=tuple(data.get("defect_link_prefixes", ()))
+    )
@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Endpoint временно отключен: подряд было слишком много ошибок"""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Истекло общее время, отведенное на отчет"""
+
+
+def full_jitter(attempt, base_delay, max_delay):
+    """Задержка перед повтором: случайная в [0, min(max_delay, base_delay * 2^attempt)]"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class Deadline:
+    """Момент, к которому должна завершиться вся работа над отчетом"""
+
+    def __init__(self, seconds):
+        self._expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self._expires_at - time.monotonic()
+
+    def check(self):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("Истекло время, отведенное на отчет")
+
+
+class RetryBudget:
+    """Общий на отчет запас повторов: один сбойный endpoint не может израсходовать все время"""
+
+    def __init__(self, retries):
+        self._left = retries
+
+    def try_spend(self):
+        if self._left <= 0:
+            return False
+        self._left -= 1
+        return True
+
+
+class RetryScope:
+    """Дедлайн и бюджет повторов текущего отчета"""
+
+    def __init__(self, deadline_seconds, retry_budget):
+        self.deadline = Deadline(deadline_seconds)
+        self.budget = RetryBudget(retry_budget)
+
+
+_current_scope = contextvars.ContextVar("retry_scope", default=None)
+
+
+@contextmanager
+def retry_scope(deadline_seconds, retry_budget):
+    """Устанавливаем дедлайн и бюджет повторов для всех запросов внутри блока
+
+    Задачи asyncio, созданные внутри блока, наследуют его через contextvars.
+    """
+    token = _current_scope.set(RetryScope(deadline_seconds, retry_budget))
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+def current_scope():
+    return _current_scope.get()
+
+
+def request_timeout(default):
+    """Таймаут запроса с учетом оставшегося до дедлайна времени"""
+    scope = current_scope()
+    if scope is None:
+        return default
+    scope.deadline.check()
+    return min(default, scope.deadline.remaining())
+
+
+class CircuitBreaker:
+    """Размыкатель для одного endpoint
+
+    После failure_threshold ошибок подряд запросы к endpoint сразу завершаются
+    CircuitOpenError. Через reset_timeout секунд пропускается один пробный
+    запрос, остальные отклоняются до его завершения: успех замыкает цепь,
+    ошибка снова размыкает ее.
+    """
+
+    def __init__(self, endpoint, failure_threshold, reset_timeout):
+        self.endpoint = endpoint
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def before_call(self):
+        """Проверяем, можно ли выполнить запрос; True - это пробный запрос"""
+        if self._opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self._opened_at < self._reset_timeout:
+            METRICS.inc("circuit_rejected", endpoint=self.endpoint)
+            raise CircuitOpenError(f"Endpoint {self.endpoint} временно недоступен")
+        # Полуоткрытое состояние: пропускаем только этот запрос
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self, probe=False):
+        self._failures += 1
+        if probe:
+            # Пробный запрос не удался - цепь снова разомкнута на reset_timeout
+            self._probing = False
+            self._open()
+        elif self._failures >= self._failure_threshold and self._opened_at is None:
+            self._open()
+
+    def release_probe(self):
+        """Пробный запрос завершился без ответа о доступности endpoint: пробу можно повторить"""
+        self._probing = False
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        METRICS.inc("circuit_opened", endpoint=self.endpoint)
+        logger.error(f"Endpoint {self.endpoint}: {self._failures} ошибок подряд, запросы приостановлены "
+                     f"на {self._reset_timeout} секунд")
+
+
+class RetryPolicy:
+    """Повтор отдельных запросов с full jitter, дедлайном, бюджетом и размыкателем
+
+    Повторяются сетевые ошибки и ответы с кодами из retry_statuses. Дедлайн и
+    бюджет берутся из текущего retry_scope, размыкатель - свой на каждый endpoint.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, retry_exceptions=(),
+                 retry_statuses=(429, 500, 502, 503, 504), failure_threshold=5, reset_timeout=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_exceptions = retry_exceptions
+        self.retry_statuses = retry_statuses
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def breaker(self, endpoint):
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, self._failure_threshold, self._reset_timeout)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    def is_retryable(self, error):
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.retry_statuses
+        return isinstance(error, self.retry_exceptions)
+
+    async def run(self, endpoint, operation):
+        """Выполняем operation() (фабрику корутины) с повторами"""
+        breaker = self.breaker(endpoint)
+        scope = current_scope()
+        attempt = 0
+        while True:
+            probe = breaker.before_call()
+            try:
+                if scope is not None:
+                    scope.deadline.check()
+                result = await operation()
+            except asyncio.CancelledError:
+                if probe:
+                    breaker.release_probe()
+                raise
+            except Exception as e:
+                if not self.is_retryable(e):
+                    if probe:
+                        breaker.release_probe()
+                    raise
+                breaker.record_failure(probe)
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    METRICS.inc("retries_exhausted", endpoint=endpoint)
+                    logger.error(f"Запрос к {endpoint} не удался после {attempt} попыток: {e}")
+                    raise
+                if scope is not None and not scope.budget.try_spend():
+                    METRICS.inc("retry_budget_exhausted", endpoint=endpoint)
+                    logger.error(f"Бюджет повторов отчета исчерпан, запрос к {endpoint} не повторяется: {e}")
+                    raise
+
+                wait_time = full_jitter(attempt, self.base_delay, self.max_delay)
+                if scope is not None and wait_time >= scope.deadline.remaining():
+                    raise DeadlineExceeded(f"Нет времени на повтор запроса к {endpoint}: {e}") from e
+                METRICS.inc("retries", endpoint=endpoint)
+                METRICS.observe("retry_backoff", wait_time, endpoint=endpoint)
+                logger.warning(f"Попытка {attempt}/{self.max_attempts} запроса к {endpoint} не удалась. "
+                               f"Ждем {wait_time:.1f} секунд перед повторной попыткой. Ошибка: {e}")
+                await asyncio.sleep(wait_time)
+            else:
+                breaker.record_success()
+                return result
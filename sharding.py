@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def shard_by(items, key):
+    """Делим items на шарды по key(item)
+
+    Возвращает список пар (ключ, [(индекс в items, item), ...]); шарды идут в
+    порядке первого появления ключа, элементы внутри шарда - в исходном порядке.
+    """
+    shards = {}
+    for index, item in enumerate(items):
+        shards.setdefault(key(item), []).append((index, item))
+    return list(shards.items())
+
+
+@dataclass(slots=True)
+class ShardProgress:
+    """Ход обработки шардов: сколько готово и с какой скоростью"""
+    name: str
+    total_shards: int
+    total_items: int
+    done_shards: int = 0
+    done_items: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self):
+        """Обработано элементов в секунду"""
+        elapsed = self.elapsed
+        return self.done_items / elapsed if elapsed > 0 else 0.0
+
+    def advance(self, items):
+        previous = self.done_shards
+        self.done_shards += 1
+        self.done_items += items
+        METRICS.inc(f"{self.name}_items", items)
+        # В лог - каждые 10% шардов, чтобы большие отчеты не засоряли его
+        if self.done_shards * 10 // self.total_shards > previous * 10 // self.total_shards:
+            logger.info(f"{self.name}: готово шардов {self.done_shards}/{self.total_shards}, "
+                        f"элементов {self.done_items}/{self.total_items}, {self.throughput:.1f} в секунду")
+
+
+async def run_sharded(shards, process, workers, queue_size, name="shard"):
+    """Обрабатываем шарды пулом из workers корутин через ограниченную очередь
+
+    shards - пары (ключ, элементы) из shard_by, process(ключ, элементы) -
+    корутина обработки шарда. Очередь вмещает не больше queue_size шардов,
+    поэтому одновременно в работе не больше workers шардов, а остальные не
+    создают задач заранее. Результаты возвращаются в порядке shards независимо
+    от порядка завершения; ошибка обработки шарда отменяет остальные.
+    """
+    progress = ShardProgress(name, len(shards), sum(len(items) for _, items in shards))
+    results = [None] * len(shards)
+    queue = asyncio.Queue(maxsize=queue_size)
+    workers = max(1, min(workers, len(shards)))
+
+    async def produce():
+        for index, shard in enumerate(shards):
+            await queue.put((index, shard))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def work():
+        while (task := await queue.get()) is not None:
+            index, (key, items) = task
+            with METRICS.span(name):
+                results[index] = await process(key, items)
+            progress.advance(len(items))
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(produce())
+        for _ in range(workers):
+            group.create_task(work())
+
+    logger.info(f"{name}: обработано {progress.done_items} элементов в {progress.total_shards} шардах "
+                f"за {progress.elapsed:.2f} с ({progress.throughput:.1f} в секунду, обработчиков {workers})")
+    return results
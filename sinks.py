@@ -0,0 +1,109 @@
+import asyncio
+import html
+import json
+import logging
+import re
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 960px; margin: 2em auto; }}
+section {{ white-space: pre-wrap; border-bottom: 1px solid #ddd; padding: 1em 0; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def html_to_text(text):
+    """Текст сообщения Telegram (HTML) без разметки"""
+    return html.unescape(_TAG_RE.sub("", text))
+
+
+class TelegramSink:
+    """Отправка отчета в чат Telegram через общую очередь TelegramSender"""
+
+    name = "telegram"
+
+    def __init__(self, sender, chat_id):
+        self._sender = sender
+        self._chat_id = chat_id
+
+    async def publish(self, report):
+        await self._sender.send_many(self._chat_id, report.messages())
+
+
+class StdoutSink:
+    """Вывод отчета в stdout обычным текстом"""
+
+    name = "stdout"
+
+    async def publish(self, report):
+        print("\n\n".join(html_to_text(message["text"]) for message in report.messages()), flush=True)
+
+
+class JsonFileSink:
+    """Сохранение структуры отчета в JSON-файл"""
+
+    name = "json"
+
+    def __init__(self, path):
+        self.path = path
+
+    async def publish(self, report):
+        await asyncio.to_thread(self._write, report.to_dict())
+
+    def _write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+class HtmlFileSink:
+    """Сохранение отчета в HTML-страницу"""
+
+    name = "html"
+
+    def __init__(self, path):
+        self.path = path
+
+    async def publish(self, report):
+        await asyncio.to_thread(self._write, report.messages())
+
+    def _write(self, messages):
+        title = html.escape(html_to_text(messages[0]["text"])) if messages else ""
+        body = "\n".join(f"<section>{message['text']}</section>" for message in messages)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(HTML_PAGE.format(title=title, body=body))
+
+
+async def publish(report, sinks):
+    """Публикуем отчет во все приемники параллельно
+
+    Ошибка одного приемника не мешает остальным; после завершения всех
+    первая ошибка пробрасывается дальше.
+    """
+
+    async def run(sink):
+        with METRICS.span("sink", sink=sink.name):
+            await sink.publish(report)
+
+    results = await asyncio.gather(*(run(sink) for sink in sinks), return_exceptions=True)
+    errors = []
+    for sink, result in zip(sinks, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Не удалось опубликовать отчет в {sink.name}: {result}")
+            errors.append(result)
+    if errors:
+        raise errors[0]
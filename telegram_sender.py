@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+
+from metrics import METRICS
+from retry import full_jitter
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Разметка HTML сообщений: теги, сущности (&amp;) и текст между ними
+_HTML_TOKEN_RE = re.compile(r"<[^<>]*>|&#?\w+;|[^<&]+|[<&]")
+_HTML_TAG_RE = re.compile(r"<(/?)([\w-]+)")
+
+
+class TokenBucket:
+    """Token bucket: не более rate событий в секунду с запасом burst"""
+
+    def __init__(self, rate, burst):
+        self._rate = rate
+        self._capacity = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def pause(self, seconds):
+        """Забираем все токены на seconds секунд (после RetryAfter от Telegram)"""
+        self._tokens = -seconds * self._rate
+        self._updated = time.monotonic()
+
+
+def _split_html_line(line, limit):
+    """Делим строку HTML на части не длиннее limit, не разрезая теги и сущности
+
+    Теги, открытые в месте разреза, закрываются в конце части и открываются
+    заново в начале следующей, поэтому каждая часть - корректный HTML.
+    """
+    parts = []
+    open_tags = []
+    current = prefix = ""
+
+    def closing(tags):
+        return "".join(f"</{name}>" for name, _ in reversed(tags))
+
+    def flush():
+        nonlocal current, prefix
+        parts.append(current + closing(open_tags))
+        current = prefix = "".join(tag for _, tag in open_tags)
+
+    for token in _HTML_TOKEN_RE.findall(line):
+        tag = _HTML_TAG_RE.match(token) if token.startswith("<") else None
+        if tag:
+            tags = list(open_tags)
+            closing_tag, name = tag.groups()
+            if closing_tag:
+                for index in range(len(tags) - 1, -1, -1):
+                    if tags[index][0] == name:
+                        del tags[index]
+                        break
+            elif not token.endswith("/>"):
+                tags.append((name, token))
+            if current != prefix and len(current) + len(token) + len(closing(tags)) > limit:
+                flush()
+            current += token
+            open_tags = tags
+            continue
+
+        # Сущность не делится, обычный текст режется в любом месте
+        atomic = token.startswith("&") and len(token) > 1
+        while token:
+            room = limit - len(current) - len(closing(open_tags))
+            if (room < len(token) if atomic else room <= 0) and current != prefix:
+                flush()
+                room = limit - len(current) - len(closing(open_tags))
+            piece = token if atomic else token[:max(room, 1)]
+            current += piece
+            token = token[len(piece):]
+    if current != prefix or not parts:
+        parts.append(current + closing(open_tags))
+    return parts
+
+
+def split_text(text, limit=MESSAGE_LIMIT):
+    """Делим текст на части не длиннее limit, по возможности по границам строк
+
+    Строка длиннее limit режется вне тегов и сущностей HTML (сообщения
+    отправляются с parse_mode HTML), см. _split_html_line.
+    """
+    parts = []
+    current = ""
+    for line in text.split("\n"):
+        if len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            *complete, line = _split_html_line(line, limit)
+            parts.extend(complete)
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def pack_messages(messages, limit=MESSAGE_LIMIT, separator="\n\n"):
+    """Упаковываем сообщения отчета в минимальное число сообщений Telegram
+
+    Соседние сообщения с одинаковыми параметрами отправки объединяются через
+    separator, пока укладываются в limit; слишком длинные делятся по строкам.
+    """
+    packed = []
+    for message in messages:
+        options = {key: value for key, value in message.items() if key != "text"}
+        for text in split_text(message["text"], limit):
+            if packed:
+                last = packed[-1]
+                last_options = {key: value for key, value in last.items() if key != "text"}
+                if last_options == options and len(last["text"]) + len(separator) + len(text) <= limit:
+                    last["text"] = f"{last['text']}{separator}{text}"
+                    continue
+            packed.append({**options, "text": text})
+    return packed
+
+
+def retry_after_seconds(error):
+    """Время ожидания из telegram.error.RetryAfter (секунды или timedelta)"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramSender:
+    """Исходящая очередь сообщений Telegram с ограничением скорости
+
+    Для каждого чата действует свой token bucket (в группах Telegram допускает
+    около 20 сообщений в минуту, в личных чатах - около одного в секунду) и
+    общий bucket на бота. Сообщения в чат уходят строго по порядку, RetryAfter
+    выдерживается, TimedOut повторяется.
+    """
+
+    def __init__(self, bot, group_rate_per_minute=20, private_rate_per_minute=60, burst=3,
+                 global_rate_per_second=30, max_retries=3):
+        self._bot = bot
+        self._group_rate = group_rate_per_minute / 60
+        self._private_rate = private_rate_per_minute / 60
+        self._burst = burst
+        self._max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate_per_second, global_rate_per_second)
+        self._buckets = {}
+        self._chat_locks = defaultdict(asyncio.Lock)
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные ID - группы и каналы, для них лимит строже
+            rate = self._group_rate if chat_id < 0 else self._private_rate
+            bucket = TokenBucket(rate, self._burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    async def send_many(self, chat_id, messages):
+        """Упаковываем и отправляем сообщения отчета в чат по порядку"""
+        packed = pack_messages(messages)
+        logger.info(f"Отправка в чат {chat_id}: {len(messages)} частей отчета упакованы в {len(packed)} сообщений")
+        async with self._chat_locks[chat_id]:
+            for message in packed:
+                await self._send(chat_id, message)
+
+    async def send(self, chat_id, **message):
+        async with self._chat_locks[chat_id]:
+            return await self._send(chat_id, message)
+
+    async def _send(self, chat_id, message):
+        # python-telegram-bot загружается только при реальной отправке
+        import telegram
+
+        bucket = self._bucket(chat_id)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                with METRICS.span("telegram_send"):
+                    return await self._bot.send_message(chat_id=chat_id, **message)
+            except telegram.error.RetryAfter as e:
+                wait_time = retry_after_seconds(e)
+                METRICS.inc("telegram_flood_wait")
+                METRICS.observe("telegram_flood_wait", wait_time)
+                logger.warning(f"Telegram ограничил отправку в чат {chat_id}, ждем {wait_time} секунд")
+                bucket.pause(wait_time)
+            except telegram.error.TimedOut as e:
+                attempt += 1
+                if attempt >= self._max_retries:
+                    raise
+                wait_time = full_jitter(attempt, 1, 30)
+                METRICS.inc("retries", endpoint="sendMessage")
+                METRICS.observe("retry_backoff", wait_time, endpoint="sendMessage")
+                logger.warning(f"Таймаут отправки в чат {chat_id}, попытка {attempt}/{self._max_retries}: {e}")
+                await asyncio.sleep(wait_time)
@@ -0,0 +1,25 @@
+from http_cache import HttpCache
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    now = [1000.0]
+    cache = HttpCache(str(tmp_path), max_bytes=250, clock=lambda: now[0])
+    for key in ("a", "b"):
+        cache.store(key, f"https://rp/{key}", 200, [], key.encode() * 100)
+        now[0] += 1
+    assert cache.lookup("a") is not None
+    now[0] += 1
+    cache.store("c", "https://rp/c", 200, [], b"c" * 100)
+    assert cache.lookup("b") is None
+    assert cache.lookup("a").body == b"a" * 100
+    assert cache.size() == 200
+    cache.close()
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=1000)
+    cache.store("a", "https://rp/a", 200, [("ETag", '"1"')], b"x" * 100)
+    cache.store("b", "https://rp/b", 200, [], b"x" * 100)
+    assert cache.size() == 100
+    assert cache.lookup("a").etag == '"1"'
+    cache.close()
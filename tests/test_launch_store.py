@@ -0,0 +1,24 @@
+from launch_store import LaunchStore
+
+
+def test_claim_notifications_returns_each_launch_once():
+    store = LaunchStore(":memory:")
+    assert store.claim_notifications("Основной", "project", [1, 2]) == [1, 2]
+    assert store.claim_notifications("Основной", "project", [2, 3]) == [3]
+    store.close()
+
+
+def test_claim_notifications_is_per_section():
+    store = LaunchStore(":memory:")
+    assert store.claim_notifications("Основной", "project", [1]) == [1]
+    assert store.claim_notifications("Ночной", "project", [1]) == [1]
+    assert store.claim_notifications("Основной", "other", [1]) == [1]
+    store.close()
+
+
+def test_start_watching_only_once_per_section():
+    store = LaunchStore(":memory:")
+    assert store.start_watching("Основной")
+    assert not store.start_watching("Основной")
+    assert store.start_watching("Ночной")
+    store.close()
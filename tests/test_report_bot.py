@@ -0,0 +1,11 @@
+from report_bot import diff_failed_items
+
+
+def test_diff_failed_items():
+    current = {"a": "test_a", "b": "test_b", "c": "test_c"}
+    previous = {"b": "test_b", "d": "test_d"}
+    assert diff_failed_items(current, previous) == (["test_a", "test_c"], ["test_d"], ["test_b"])
+
+
+def test_diff_failed_items_without_previous_failures():
+    assert diff_failed_items({"a": "test_a"}, {}) == (["test_a"], [], [])
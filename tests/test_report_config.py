@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from report_bot import Launch
+from report_config import LaunchFilterSpec, RUNNING_STATUSES, ReportSection
+
+NOW = datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def make_launch(launch_id, status="PASSED", hours_ago=1, **attributes):
+    return Launch.from_api({
+        "id": launch_id,
+        "name": f"launch {launch_id}",
+        "number": launch_id,
+        "status": status,
+        "startTime": (NOW - timedelta(hours=hours_ago)).isoformat(),
+        "attributes": [{"key": key.replace("_", " "), "value": value} for key, value in attributes.items()],
+    }, "project")
+
+
+def test_filter_checks_attributes_and_statuses():
+    spec = LaunchFilterSpec(attributes=(("Db type", "postgres"),), statuses=("PASSED", "FAILED"))
+    assert spec.matches(make_launch(1, Db_type="postgres"))
+    assert not spec.matches(make_launch(2, Db_type="oracle"))
+    assert not spec.matches(make_launch(3, status="STOPPED", Db_type="postgres"))
+
+
+def test_filter_excluded_statuses_and_required_keys():
+    spec = LaunchFilterSpec(excluded_statuses=RUNNING_STATUSES, required_keys=("Branch",))
+    assert spec.matches(make_launch(1, status="RESETED", Branch="main"))
+    assert not spec.matches(make_launch(2, status="IN_PROGRESS", Branch="main"))
+    assert not spec.matches(make_launch(3, Branch=""))
+
+
+def test_filter_attribute_prefixes():
+    spec = LaunchFilterSpec(attribute_prefixes=(("Version", ("3.30", "3.29")),))
+    assert spec.matches(make_launch(1, Version="3.30.1"))
+    assert not spec.matches(make_launch(2, Version="3.28.5"))
+    assert not spec.matches(make_launch(3))
+
+
+def test_select_takes_latest_launch_per_version_in_versions_order():
+    section = ReportSection(
+        name="Основной", project="project", window_hours=24,
+        filter=LaunchFilterSpec(attribute_prefixes=(("Version", ("3.30", "3.29")),)),
+        version_attribute="Version", versions=("3.30", "3.29"),
+    )
+    launches = [
+        make_launch(1, hours_ago=5, Version="3.29.1"),
+        make_launch(2, hours_ago=1, Version="3.29.2"),
+        make_launch(3, hours_ago=3, Version="3.30.0"),
+        make_launch(4, hours_ago=2, Version="3.28.0"),
+    ]
+    assert [launch.id for launch in section.select(launches)] == [3, 2]
+
+
+def test_select_groups_by_attributes():
+    section = ReportSection(name="Linux", project="project", window_hours=24, filter=LaunchFilterSpec(),
+                            group_by=("Branch",))
+    launches = [
+        make_launch(1, hours_ago=3, Branch="main"),
+        make_launch(2, hours_ago=1, Branch="main"),
+        make_launch(3, hours_ago=2, Branch="feature"),
+    ]
+    assert sorted(launch.id for launch in section.select(launches)) == [2, 3]
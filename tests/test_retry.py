@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+
+from retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def _policy(**kwargs):
+    options = {"max_attempts": 3, "base_delay": 0, "max_delay": 0,
+               "retry_exceptions": (httpx.TransportError,), "failure_threshold": 2, "reset_timeout": 0.05}
+    options.update(kwargs)
+    return RetryPolicy(**options)
+
+
+def test_retry_policy_retries_network_errors():
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if len(calls) < 3:
+            raise httpx.ConnectError("нет соединения")
+        return "ok"
+
+    assert asyncio.run(_policy(failure_threshold=10).run("launch", operation)) == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_policy_does_not_retry_other_errors():
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise ValueError("ошибка разбора")
+
+    with pytest.raises(ValueError):
+        asyncio.run(_policy().run("launch", operation))
+    assert len(calls) == 1
+
+
+def test_circuit_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("launch", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.before_call() is False
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_circuit_admits_single_probe():
+    async def scenario():
+        policy = _policy(max_attempts=1)
+        breaker = policy.breaker("launch")
+        breaker.record_failure()
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+
+        release = asyncio.Event()
+        started = []
+
+        async def operation():
+            started.append(1)
+            await release.wait()
+            return "ok"
+
+        tasks = [asyncio.create_task(policy.run("launch", operation)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True), started
+
+    results, started = asyncio.run(scenario())
+    assert len(started) == 1
+    assert results.count("ok") == 1
+    assert sum(isinstance(result, CircuitOpenError) for result in results) == 4
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("launch", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure(probe=True)
+    assert breaker.before_call() is True
+    breaker.record_success()
+    assert breaker.before_call() is False
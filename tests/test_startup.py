@@ -0,0 +1,12 @@
+from bench import STARTUP_BUDGET_MS, measure_import
+
+
+def test_main_does_not_load_forbidden_modules():
+    _, forbidden = measure_import("main", runs=1)
+    assert forbidden == []
+
+
+def test_report_bot_import_within_budget():
+    milliseconds, forbidden = measure_import("report_bot", runs=3)
+    assert forbidden == []
+    assert milliseconds <= STARTUP_BUDGET_MS
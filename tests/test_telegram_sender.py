@@ -0,0 +1,49 @@
+import re
+
+from telegram_sender import pack_messages, split_text
+
+
+def _balanced(part):
+    """Теги части закрыты в обратном порядке, сущности не разрезаны"""
+    stack = []
+    for closing, name in re.findall(r"<(/?)(\w+)[^>]*>", part):
+        if closing:
+            assert stack and stack.pop() == name
+        else:
+            stack.append(name)
+    return not stack and not re.search(r"&#?\w*$", part)
+
+
+def test_split_text_keeps_short_text_whole():
+    assert split_text("строка 1\nстрока 2", limit=100) == ["строка 1\nстрока 2"]
+
+
+def test_split_text_splits_by_lines():
+    text = "\n".join(f"строка {number}" for number in range(10))
+    parts = split_text(text, limit=30)
+    assert all(len(part) <= 30 for part in parts)
+    assert "\n".join(parts) == text
+
+
+def test_split_text_long_line_does_not_cut_tags_or_entities():
+    line = " ".join(f'<a href="https://jira.a2nta.ru/browse/QA-{n}">QA-{n} &amp; <b>bold</b></a>' for n in range(50))
+    parts = split_text(line, limit=200)
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= 200
+        assert _balanced(part)
+    assert re.sub(r"<[^>]*>", "", "".join(parts)) == re.sub(r"<[^>]*>", "", line)
+
+
+def test_pack_messages_joins_messages_with_same_options():
+    messages = [{"text": "a", "parse_mode": "HTML"}, {"text": "b", "parse_mode": "HTML"}, {"text": "c"}]
+    assert pack_messages(messages, limit=100) == [
+        {"parse_mode": "HTML", "text": "a\n\nb"},
+        {"text": "c"},
+    ]
+
+
+def test_pack_messages_respects_limit():
+    messages = [{"text": "x" * 60}, {"text": "y" * 60}]
+    packed = pack_messages(messages, limit=100)
+    assert [message["text"] for message in packed] == ["x" * 60, "y" * 60]
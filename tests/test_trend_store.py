@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from trend_store import TrendStore
+
+NOW = datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def make_launch(launch_id, days_ago, total, passed):
+    statistics = SimpleNamespace(total=total, passed=passed, failed=total - passed, skipped=0)
+    return SimpleNamespace(id=launch_id, project="project", start_time=NOW - timedelta(days=days_ago),
+                           statistics=statistics)
+
+
+def test_summary_compares_with_baseline():
+    store = TrendStore(":memory:")
+    store.record([
+        ("3.30", make_launch(1, 8, 100, 80), ["QA-1", "QA-2"]),
+        ("3.30", make_launch(2, 4, 100, 85), ["QA-2"]),
+        ("3.30", make_launch(3, 0, 100, 90), ["QA-2", "QA-3"]),
+        ("3.29", make_launch(4, 30, 10, 10), []),
+    ])
+    summary = store.summary(7, NOW - timedelta(days=1))
+    assert len(summary) == 1
+    trend = summary[0]
+    assert trend["launch_key"] == "3.30"
+    assert trend["launch_id"] == 3
+    assert trend["baseline_id"] == 1
+    assert trend["pass_rate"] == 0.9
+    assert trend["baseline_pass_rate"] == 0.8
+    assert trend["new_defects"] == ["QA-3"]
+    assert trend["resolved_defects"] == ["QA-1"]
+    store.close()
+
+
+def test_summary_counts_flaky_defects():
+    store = TrendStore(":memory:")
+    store.record([
+        ("3.30", make_launch(1, 3, 10, 9), ["QA-1"]),
+        ("3.30", make_launch(2, 2, 10, 10), []),
+        ("3.30", make_launch(3, 1, 10, 9), ["QA-1"]),
+    ])
+    trend, = store.summary(7, NOW - timedelta(days=2))
+    assert trend["baseline_id"] is None
+    assert trend["flaky"] == 1
+    store.close()
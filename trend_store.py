@@ -0,0 +1,190 @@
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Последний запуск каждого ключа и базовый запуск для сравнения: самый свежий
+# из начавшихся не позже, чем за period секунд до последнего
+_BASELINE_CTE = """
+    ranked AS (
+        SELECT project, launch_key, launch_id, start_ts, total, passed,
+               ROW_NUMBER() OVER (PARTITION BY project, launch_key ORDER BY start_ts DESC, launch_id DESC) AS rn
+        FROM launch_history
+    ),
+    latest AS (
+        SELECT * FROM ranked WHERE rn = 1 AND start_ts >= :active_since
+    ),
+    baseline AS (
+        SELECT * FROM (
+            SELECT h.project, h.launch_key, h.launch_id, h.total, h.passed,
+                   ROW_NUMBER() OVER (PARTITION BY h.project, h.launch_key
+                                      ORDER BY h.start_ts DESC, h.launch_id DESC) AS rn
+            FROM launch_history h
+            JOIN latest l ON l.project = h.project AND l.launch_key = h.launch_key
+            WHERE h.start_ts <= l.start_ts - :period
+        ) WHERE rn = 1
+    )
+"""
+
+
+class TrendStore:
+    """История статистики запусков и дефектов для отчета о трендах
+
+    Каждый запуск из отчета сохраняется один раз (повторная запись обновляет
+    его статистику и дефекты). Запуски группируются по ключу: версии для
+    основных прогонов, ветке для Linux. Сравнения и подсчеты выполняются
+    агрегатными SQL-запросами по индексам, без обращений к ReportPortal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS launch_history (
+                project TEXT NOT NULL,
+                launch_id INTEGER NOT NULL,
+                launch_key TEXT NOT NULL,
+                start_ts REAL NOT NULL,
+                total INTEGER NOT NULL,
+                passed INTEGER NOT NULL,
+                failed INTEGER NOT NULL,
+                skipped INTEGER NOT NULL,
+                PRIMARY KEY (project, launch_id)
+            );
+            CREATE INDEX IF NOT EXISTS launch_history_key_start
+                ON launch_history (project, launch_key, start_ts);
+            CREATE TABLE IF NOT EXISTS launch_defects (
+                project TEXT NOT NULL,
+                launch_id INTEGER NOT NULL,
+                link TEXT NOT NULL,
+                PRIMARY KEY (project, launch_id, link)
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, entries):
+        """Сохраняем запуски отчета
+
+        entries - кортежи (launch_key, launch, links), где launch - Launch, а
+        links - список ссылок на дефекты или None, если их не удалось получить
+        (тогда ранее сохраненные дефекты запуска не трогаются).
+        """
+        with self._lock:
+            for launch_key, launch, links in entries:
+                stats = launch.statistics
+                self._conn.execute("""
+                    INSERT INTO launch_history
+                        (project, launch_id, launch_key, start_ts, total, passed, failed, skipped)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (project, launch_id) DO UPDATE SET
+                        launch_key = excluded.launch_key,
+                        total = excluded.total,
+                        passed = excluded.passed,
+                        failed = excluded.failed,
+                        skipped = excluded.skipped
+                """, (launch.project, launch.id, launch_key, launch.start_time.timestamp(),
+                      stats.total, stats.passed, stats.failed, stats.skipped))
+                if links is None:
+                    continue
+                self._conn.execute("DELETE FROM launch_defects WHERE project = ? AND launch_id = ?",
+                                   (launch.project, launch.id))
+                self._conn.executemany(
+                    "INSERT INTO launch_defects (project, launch_id, link) VALUES (?, ?, ?)",
+                    [(launch.project, launch.id, link) for link in links]
+                )
+            self._conn.commit()
+
+    def summary(self, period_days, active_since):
+        """Сравнение последнего запуска каждого ключа с запуском period_days назад
+
+        Учитываются только ключи, последний запуск которых начался после
+        active_since. Для каждого ключа возвращается словарь: доля пройденных
+        тестов сейчас и в базовом запуске, новые и исправленные дефекты и число
+        нестабильных дефектов (пропадавших и появлявшихся снова) за период.
+        """
+        params = {"period": period_days * 86400, "active_since": active_since.timestamp()}
+        with self._lock:
+            rates = self._conn.execute(f"""
+                WITH {_BASELINE_CTE}
+                SELECT l.project, l.launch_key, l.launch_id, l.passed, l.total, b.launch_id, b.passed, b.total
+                FROM latest l
+                LEFT JOIN baseline b ON b.project = l.project AND b.launch_key = l.launch_key
+                ORDER BY l.project, l.launch_key
+            """, params).fetchall()
+            changes = self._conn.execute(f"""
+                WITH {_BASELINE_CTE},
+                current_links AS (
+                    SELECT l.project, l.launch_key, d.link FROM latest l
+                    JOIN launch_defects d ON d.project = l.project AND d.launch_id = l.launch_id
+                    JOIN baseline b ON b.project = l.project AND b.launch_key = l.launch_key
+                ),
+                baseline_links AS (
+                    SELECT b.project, b.launch_key, d.link FROM baseline b
+                    JOIN launch_defects d ON d.project = b.project AND d.launch_id = b.launch_id
+                ),
+                appeared AS (SELECT * FROM current_links EXCEPT SELECT * FROM baseline_links),
+                resolved AS (SELECT * FROM baseline_links EXCEPT SELECT * FROM current_links)
+                SELECT project, launch_key, 'new', link FROM appeared
+                UNION ALL
+                SELECT project, launch_key, 'resolved', link FROM resolved
+                ORDER BY 1, 2, 4
+            """, params).fetchall()
+            # Дефект нестабилен, если между его первым и последним появлением
+            # за период были запуски того же ключа без него
+            flaky = self._conn.execute("""
+                WITH appearances AS (
+                    SELECT h.project, h.launch_key, d.link, COUNT(*) AS seen,
+                           MIN(h.start_ts) AS first_ts, MAX(h.start_ts) AS last_ts
+                    FROM launch_defects d
+                    JOIN launch_history h ON h.project = d.project AND h.launch_id = d.launch_id
+                    WHERE h.start_ts >= (SELECT MAX(start_ts) FROM launch_history) - :period
+                    GROUP BY h.project, h.launch_key, d.link
+                )
+                SELECT a.project, a.launch_key, COUNT(*) FROM appearances a
+                WHERE a.seen < (
+                    SELECT COUNT(*) FROM launch_history h
+                    WHERE h.project = a.project AND h.launch_key = a.launch_key
+                      AND h.start_ts BETWEEN a.first_ts AND a.last_ts
+                )
+                GROUP BY a.project, a.launch_key
+            """, params).fetchall()
+
+        flaky_counts = {(project, launch_key): count for project, launch_key, count in flaky}
+        result = {}
+        for project, launch_key, launch_id, passed, total, base_id, base_passed, base_total in rates:
+            result[(project, launch_key)] = {
+                "project": project,
+                "launch_key": launch_key,
+                "launch_id": launch_id,
+                "pass_rate": passed / total if total else None,
+                "baseline_id": base_id,
+                "baseline_pass_rate": base_passed / base_total if base_total else None,
+                "new_defects": [],
+                "resolved_defects": [],
+                "flaky": flaky_counts.get((project, launch_key), 0)
+            }
+        for project, launch_key, kind, link in changes:
+            result[(project, launch_key)][f"{kind}_defects"].append(link)
+        return list(result.values())
+
+    def prune(self, before):
+        """Удаляем историю запусков, начавшихся раньше before"""
+        with self._lock:
+            self._conn.execute("""
+                DELETE FROM launch_defects WHERE (project, launch_id) IN (
+                    SELECT project, launch_id FROM launch_history WHERE start_ts < ?
+                )
+            """, (before.timestamp(),))
+            deleted = self._conn.execute(
+                "DELETE FROM launch_history WHERE start_ts < ?", (before.timestamp(),)
+            ).rowcount
+            self._conn.commit()
+        if deleted:
+            logger.info(f"Из истории трендов удалено {deleted} устаревших запусков")
+        return deleted